@@ -0,0 +1,137 @@
+"""
+Benchmark of graph_upload.upload_in_chunks against a local stand-in for a Microsoft Graph
+upload session, which can drop a share of the chunk requests.
+
+A dropped chunk is either refused before it is stored, or stored and then answered with an
+error, so resuming has to ask the session where to continue. Like Graph, the session is gone
+once the file is complete, so a lost response to the last chunk has to be settled by looking
+for the file. Each run checks that the uploaded bytes match the file.
+
+Run from the repository root with: python -m benchmarks.bench_chunked_upload
+"""
+
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from helpers.graph_upload import upload_in_chunks
+
+FILE_SIZES = (5 * 1024 * 1024, 50 * 1024 * 1024)
+FAILURE_RATES = (0.0, 0.2)
+CHUNK_SIZE = 10 * 320 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class _UploadSession:
+    """The bytes received so far by the stand-in upload session"""
+
+    def __init__(self, failure_rate: float, seed: int = 42):
+        self.failure_rate = failure_rate
+        self.received = bytearray()
+        self.completed = False
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+
+def _make_handler(session: _UploadSession):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):
+            with session.lock:
+                if session.completed:
+                    self._reply(404, {"error": {"code": "itemNotFound"}})
+                    return
+
+                self._reply(200, {"nextExpectedRanges": [f"{len(session.received)}-"]})
+
+        def do_PUT(self):
+            start, end, total = map(int, _CONTENT_RANGE.fullmatch(self.headers["Content-Range"]).groups())
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+
+            with session.lock:
+                if session.completed:
+                    self._reply(404, {"error": {"code": "itemNotFound"}})
+                    return
+
+                failure = session.rng.random() < session.failure_rate
+                stored_before_failure = failure and session.rng.random() < 0.5
+
+                if failure and not stored_before_failure:
+                    self._reply(503, {"error": {"code": "serviceNotAvailable"}})
+                    return
+
+                if start != len(session.received) or end - start + 1 != len(body):
+                    self._reply(416, {"error": {"code": "invalidRange"}})
+                    return
+
+                session.received.extend(body)
+                session.completed = len(session.received) == total
+
+                if stored_before_failure:
+                    self._reply(500, {"error": {"code": "generalException"}})
+
+                elif session.completed:
+                    self._reply(201, {"id": "item", "size": total})
+
+                else:
+                    self._reply(202, {"nextExpectedRanges": [f"{len(session.received)}-"]})
+
+        def _reply(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def _run(size: int, failure_rate: float):
+    session = _UploadSession(failure_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(session))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    upload_url = f"http://127.0.0.1:{server.server_address[1]}/upload-session"
+
+    try:
+        with tempfile.TemporaryFile() as file, requests.Session() as http:
+            content = os.urandom(size)
+            file.write(content)
+
+            stats = upload_in_chunks(
+                http, upload_url, file, size, chunk_size=CHUNK_SIZE, max_retries=10, file_exists=lambda: session.completed,
+            )
+
+        assert bytes(session.received) == content, "uploaded bytes differ from the file"
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(
+        f"{size / 1e6:>7.1f} MB  failure rate {failure_rate:>4.0%}  {stats.chunks:>4} chunks  "
+        f"{stats.resumes:>3} resumes  {stats.seconds:>6.2f}s  {stats.throughput / 1e6:>7.1f} MB/s"
+    )
+
+
+def main():
+    """Upload each file size at each failure rate and check the result."""
+    for size in FILE_SIZES:
+        for failure_rate in FAILURE_RATES:
+            _run(size, failure_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of helper_functions._clean_value against the previous implementation,
+which ran ast.literal_eval on every string.
+
+Run from the repository root with: python -m benchmarks.bench_clean_value
+"""
+
+import ast
+import random
+import timeit
+
+from helpers import helper_functions
+
+NUMBER_OF_VALUES = 30_000
+REPEATS = 5
+
+SAMPLE_VALUES = [
+    "Arabisk",
+    "Somali",
+    "Tigrinya",
+    "Kurdisk (kurmanji)",
+    "0. klasse",
+    "5. klasse",
+    "Folkeskole",
+    "Ellekærskolen",
+    "Skjoldhøjskolen",
+    "Ja",
+    "Nej",
+    "3",
+    "751",
+    "Søndergade 1, 1. th., 8000 Aarhus C",
+    "Vi er flyttet til Danmark i 2023.\r\nHun taler kun arabisk derhjemme.",
+    "['Arabisk', 'Somali']",
+    '["Dari"]',
+    "Han siger \"hej\" på dansk",
+    " Mellemrum omkring ",
+    "",
+]
+
+
+def _clean_value_reference(value):
+    """The implementation before the fast path, kept here for comparison."""
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+
+    if isinstance(value, str):
+        value = value.replace("\r\n", ". ").replace("\n", ". ")
+
+        try:
+            parsed = ast.literal_eval(value)
+
+            if isinstance(parsed, list):
+                return ", ".join(str(v) for v in parsed)
+
+        except Exception:
+            return value.strip("[]").replace("'", "").replace('"', "").strip()
+
+    return value
+
+
+def main():
+    """Check that both implementations agree, then time them on the same values."""
+    rng = random.Random(42)
+    values = [rng.choice(SAMPLE_VALUES) for _ in range(NUMBER_OF_VALUES)]
+
+    for value in SAMPLE_VALUES:
+        assert helper_functions._clean_value(value) == _clean_value_reference(value), value
+
+    def run_reference():
+        for value in values:
+            _clean_value_reference(value)
+
+    def run_current():
+        helper_functions._clean_string.cache_clear()
+        for value in values:
+            helper_functions._clean_value(value)
+
+    reference = min(timeit.repeat(run_reference, number=1, repeat=REPEATS))
+    current = min(timeit.repeat(run_current, number=1, repeat=REPEATS))
+
+    print(f"{NUMBER_OF_VALUES} values, best of {REPEATS}")
+    print(f"reference: {reference * 1000:8.1f} ms")
+    print(f"current:   {current * 1000:8.1f} ms")
+    print(f"speedup:   {reference / current:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
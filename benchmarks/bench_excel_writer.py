@@ -0,0 +1,121 @@
+"""
+Benchmark of excel_writer.write_submissions_workbook against the previous workbook build,
+which made a DataFrame of the submissions and wrote it with to_excel into a BytesIO.
+
+Each case runs in a fresh process, once for wall time and peak RSS, and once under
+tracemalloc for the peak of Python allocations. The peak RSS is read like
+helpers.memory_profile does, and shown as n/a where no way of reading it is available.
+
+Run from the repository root with: python -m benchmarks.bench_excel_writer [rows ...]
+"""
+
+import multiprocessing
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from helpers import config
+from helpers.excel_writer import write_submissions_workbook
+from helpers.memory_profile import _process_peak_rss
+
+DEFAULT_ROW_COUNTS = (1_000, 10_000, 100_000)
+SHEET_NAME = "Besvarelser"
+
+LANGUAGES = ["Arabisk", "Somali", "Tigrinya", "Dari", "Kurdisk (kurmanji)", "Tyrkisk", "Ukrainsk"]
+SCHOOLS = ["Ellekærskolen", "Skjoldhøjskolen", "Frydenlundskolen", "Tilst Skole", "Vestergårdsskolen"]
+
+
+def _synthetic_submissions(row_count: int, columns: list[str]) -> list[dict]:
+    """Transformed submissions with the weekly work item's columns and varied text."""
+    rng = random.Random(42)
+    submissions = []
+
+    for serial in range(row_count):
+        row = {column: f"{column} {rng.randint(0, 10**6)}" for column in columns}
+        row["Serial number"] = serial + 1
+        row["Ønsket sprog"] = rng.choice(LANGUAGES)
+        row["Skole"] = rng.choice(SCHOOLS)
+        row["Elevens CPR-nummer"] = f"{rng.randint(10**9, 10**10 - 1):010d}"
+        submissions.append(row)
+
+    return submissions
+
+
+def _build_previous(submissions: list[dict], columns: list[str]) -> bytes:
+    """The previous build, kept here for comparison."""
+    submissions_df = pd.DataFrame(submissions, columns=columns)
+
+    excel_stream = BytesIO()
+    submissions_df.to_excel(excel_stream, index=False, engine="openpyxl", sheet_name=SHEET_NAME)
+    excel_stream.seek(0)
+
+    return excel_stream.getvalue()
+
+
+def _build_streaming(submissions: list[dict], columns: list[str]) -> bytes:
+    with write_submissions_workbook(submissions, columns, SHEET_NAME) as excel_file:
+        return excel_file.read()
+
+
+BUILDERS = {"previous": _build_previous, "streaming": _build_streaming}
+
+
+def _measure(builder_name: str, row_count: int, trace: bool, results):
+    columns = list(config.MODERSMAAL_CONFIG["formular_mapping"].values())
+    submissions = _synthetic_submissions(row_count, columns)
+    builder = BUILDERS[builder_name]
+
+    if trace:
+        tracemalloc.start()
+        builder(submissions, columns)
+        results.put(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        return
+
+    rss_before = _process_peak_rss()
+    start = time.perf_counter()
+    content = builder(submissions, columns)
+    elapsed = time.perf_counter() - start
+    rss_after = _process_peak_rss()
+
+    rss_growth = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+    results.put((elapsed, rss_growth, len(content)))
+
+
+def _run_in_process(builder_name: str, row_count: int, trace: bool):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(builder_name, row_count, trace, results))
+    process.start()
+    result = results.get()
+    process.join()
+
+    return result
+
+
+def main():
+    """Time and measure both builds at each row count."""
+    row_counts = [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROW_COUNTS
+
+    print(f"{'rows':>8}  {'build':<10} {'wall':>9} {'peak RSS +':>11} {'peak traced':>12} {'size':>9}")
+
+    for row_count in row_counts:
+        for builder_name in BUILDERS:
+            elapsed, rss_growth, size = _run_in_process(builder_name, row_count, trace=False)
+            traced_peak = _run_in_process(builder_name, row_count, trace=True)
+
+            rss = f"{rss_growth / 1e6:>9.1f}MB" if rss_growth is not None else f"{'n/a':>11}"
+
+            print(
+                f"{row_count:>8}  {builder_name:<10} {elapsed:>8.2f}s {rss} "
+                f"{traced_peak / 1e6:>10.1f}MB {size / 1e6:>7.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
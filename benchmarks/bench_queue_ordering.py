@@ -0,0 +1,65 @@
+"""
+Benchmark of the ordering strategies in queue_handler.order_items against the previous
+sort key, which serialized every whole item to sorted JSON.
+
+Run from the repository root with: python -m benchmarks.bench_queue_ordering
+"""
+
+import json
+import random
+import time
+
+from helpers import config
+from processes import queue_handler
+
+NUMBER_OF_ITEMS = 20
+SUBMISSIONS_PER_ITEM = 5_000
+
+
+def _create_sort_key_reference(item: dict) -> str:
+    """The previous sort key, kept here for comparison."""
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def _synthetic_items(rng: random.Random) -> list[dict]:
+    """Items shaped like the weekly work item, each holding a week of transformed submissions."""
+    columns = list(config.MODERSMAAL_CONFIG["formular_mapping"].values())
+    items = []
+
+    for item_number in range(NUMBER_OF_ITEMS):
+        submissions = [
+            {column: f"{column} {rng.randint(0, 10**9)}" for column in columns}
+            for _ in range(SUBMISSIONS_PER_ITEM)
+        ]
+        items.append({
+            "reference": f"tilmelding_til_modersmaalsunderv_{item_number:04d}",
+            "data": {"config": {"folder_name": "General"}, "submissions": submissions},
+        })
+
+    rng.shuffle(items)
+
+    return items
+
+
+def _timed(function) -> float:
+    start = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start
+
+
+def main():
+    """Time each ordering strategy on the same synthetic items."""
+    items = _synthetic_items(random.Random(42))
+    payload_mb = sum(len(json.dumps(it, ensure_ascii=False)) for it in items) / 1e6
+
+    print(f"{NUMBER_OF_ITEMS} items, {SUBMISSIONS_PER_ITEM} submissions each, {payload_mb:.1f} MB of JSON")
+    print(f"full JSON sort key (previous): {_timed(lambda: sorted(items, key=_create_sort_key_reference)) * 1000:9.1f} ms")
+
+    for strategy in ("reference", "content_hash", "none"):
+        elapsed = _timed(lambda strategy=strategy: queue_handler.order_items(items, strategy))
+        print(f"{strategy + ':':<30} {elapsed * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Load test of the queue paths against benchmarks.fake_ats.FakeATSServer: listing the workqueue
+and concurrent_add when populating, and process_workqueue with a simulated process_item.
+
+Reports throughput, tail latencies, throttled and failed requests, how many added items arrived
+and whether any claimed item was left unprocessed. With automation_server_client installed, its own
+Workqueue talks to the stand-in, and any request the stand-in did not understand is listed and
+fails the run. Error emails are never sent: errors are handled as usual, but
+with send_mail switched off.
+
+Run from the repository root with:
+    python -m benchmarks.bench_queue_paths [--items 2000] [--existing 20000] [--latency 0.05]
+        [--error-rate 0.01] [--throttle-rate 0.02] [--workers 1 4 16] [--work-time 0.05]
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import logging
+import os
+import random
+import sys
+import time
+
+from mbu_rpa_core.exceptions import BusinessError
+
+import main as process_main
+from benchmarks.fake_ats import (
+    FakeATSServer,
+    FakeWorkqueue,
+    FaultConfig,
+    client_workqueue,
+    percentiles,
+)
+from helpers import ats_functions, config
+from processes import error_handling, queue_handler
+
+BUSINESS_ERROR_SHARE = 0.05  # simulated items that end pending the user
+PROCESS_ERROR_SHARE = 0.02  # simulated items that fail
+
+
+def _format_latencies(values: list[float]) -> str:
+    return "  ".join(f"{name} {value * 1000:6.1f} ms" for name, value in percentiles(values).items())
+
+
+def _workqueue(server: FakeATSServer, workqueue_id: int):
+    return client_workqueue(server, workqueue_id) or FakeWorkqueue(server.url, workqueue_id=workqueue_id, token=server.token)
+
+
+def _populate(server: FakeATSServer, items: int, existing: int, workqueue_id: int):
+    """List a workqueue holding existing items, then add new ones with concurrent_add."""
+    workqueue = _workqueue(server, workqueue_id)
+    server.seed_items(workqueue.id, existing)
+    server.reset_stats()
+
+    start = time.perf_counter()
+    references = ats_functions.get_workqueue_items(workqueue)
+    listed = time.perf_counter() - start
+
+    new_items = [
+        {"reference": f"item_{index:06d}", "data": {"config": {}, "submissions": []}}
+        for index in range(items)
+    ]
+
+    start = time.perf_counter()
+    asyncio.run(queue_handler.concurrent_add(workqueue, new_items))
+    added = time.perf_counter() - start
+
+    responses = dict(server.responses["add"])
+    arrived = server.status_counts(workqueue.id).get("new", 0)
+
+    print(f"\nPopulate: {existing} existing items, {items} new items")
+    print(f"  listing   {len(references):>7} references in {listed:6.2f}s  {_format_latencies(server.latencies['items'])}")
+    print(f"  adding    {arrived:>7} of {items} arrived in {added:6.2f}s, {arrived / added:7.0f} items/s")
+    print(f"  add requests {sum(responses.values())}: {responses}  {_format_latencies(server.latencies['add'])}")
+
+
+def _simulated_process_item(work_time: float, rng: random.Random):
+    def process_item(item_data: dict):
+        time.sleep(work_time)
+        roll = rng.random()
+
+        if roll < BUSINESS_ERROR_SHARE:
+            raise BusinessError("Simulated business error")
+
+        if roll < BUSINESS_ERROR_SHARE + PROCESS_ERROR_SHARE:
+            raise RuntimeError("Simulated process error")
+
+        return "Simulated"
+
+    return process_item
+
+
+def _handle_error_without_mail(error, log, context=None):
+    if context is not None:
+        context = dataclasses.replace(context, send_mail=False)
+
+    error_handling.handle_error(error=error, log=log, context=context)
+
+
+def _process(server: FakeATSServer, items: int, workers: int, work_time: float, workqueue_id: int):
+    """Claim and process items with the given number of workers."""
+    workqueue = _workqueue(server, workqueue_id)
+
+    for index in range(items):
+        reference = f"process_{index:06d}"
+        server._add(workqueue.id, {"item": {"reference": reference, "data": {"config": {}, "submissions": []}}}, reference)
+
+    server.reset_stats()
+    config.PROCESS_WORKERS = workers
+    process_main.process_item = _simulated_process_item(work_time, random.Random(workers))
+
+    start = time.perf_counter()
+    asyncio.run(process_main.process_workqueue(workqueue))
+    elapsed = time.perf_counter() - start
+
+    item_latencies = [
+        server.items[item_id]["finished_at"] - server.items[item_id]["claimed_at"]
+        for item_id in server.workqueues[workqueue.id]
+        if "finished_at" in server.items[item_id]
+    ]
+
+    print(f"\nProcess: {items} items, {workers} workers, {work_time * 1000:.0f} ms of work per item")
+    print(f"  {elapsed:6.2f}s, {items / elapsed:7.1f} items/s  statuses {server.status_counts(workqueue.id)}")
+    print(f"  per item   {_format_latencies(item_latencies)}")
+    print(f"  claims     {_format_latencies(server.latencies['next_item'])}")
+
+    statuses = server.status_counts(workqueue.id)
+    unfinished = statuses.get("new", 0) + statuses.get("in progress", 0)
+
+    if unfinished:
+        print(f"  {unfinished} items were not processed")
+
+
+def main():
+    """Run the populate and process scenarios against one stand-in server."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=2_000)
+    parser.add_argument("--existing", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--throttle-rate", type=float, default=0.02)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--process-items", type=int, default=200)
+    parser.add_argument("--work-time", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # The simulated process errors are logged as errors, one per item
+    logging.basicConfig(level=logging.CRITICAL)
+
+    faults = FaultConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+
+    # Error emails are never sent from a load test
+    process_main.handle_error = _handle_error_without_mail
+
+    with FakeATSServer(faults) as server:
+        os.environ["ATS_URL"] = server.url
+        os.environ["ATS_TOKEN"] = server.token
+
+        print(
+            f"Stand-in server at {server.url}: {args.latency * 1000:.0f} ms latency (+ up to {args.jitter * 1000:.0f} ms), "
+            f"{args.error_rate:.0%} errors and {args.throttle_rate:.0%} throttled on {sorted(faults.routes)}"
+        )
+
+        client = "automation_server_client" if client_workqueue(server, 1) is not None else "FakeWorkqueue, protocol not checked"
+        print(f"Workqueue client: {client}")
+
+        _populate(server, args.items, args.existing, workqueue_id=1)
+
+        for index, workers in enumerate(args.workers, start=2):
+            _process(server, args.process_items, workers, args.work_time, workqueue_id=index)
+
+    if server.rejected:
+        print(f"\n{len(server.rejected)} requests the stand-in did not understand, the first ones:")
+
+        for method, target, status in server.rejected[:10]:
+            print(f"  {status} {method} {target}")
+
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
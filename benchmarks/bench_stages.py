@@ -0,0 +1,252 @@
+"""
+Offline benchmark of each stage of a weekly run, on synthetic submissions from
+benchmarks.synthetic_forms, at several sizes.
+
+Stages:
+    fetch_decode     reading database rows in batches and parsing form_data, as iter_form_rows does
+    date_filter      keeping the submissions completed last week
+    transform        transform_columnar into the rows of the work item
+    excel_build      writing the sorted, formatted workbook
+    queue_serialize  serializing the work item for the workqueue
+    queue_insert     concurrent_add of the week, sharded by size, into an in-memory workqueue
+
+Each size is run twice: once for wall time, and once under tracemalloc for the peak of Python
+allocations in each stage, above what was allocated when the stage started. The results are
+saved as JSON, and --compare prints the change against an earlier results file.
+
+Run from the repository root with:
+    python -m benchmarks.bench_stages [--sizes 1000 10000 100000] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks import synthetic_forms
+from helpers import config, helper_functions
+from helpers.excel_writer import write_submissions_workbook
+from processes import queue_handler
+from processes.process_item import SHEET_NAME, WORKBOOK_FORMATTING
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+WEEK_START = datetime.date(2025, 9, 15)
+
+
+class _FakeResult:
+    """Stands in for the query result, handing out the generated rows like a cursor."""
+
+    def __init__(self, rows: list[tuple]):
+        self._rows = [SimpleNamespace(form_id=i, form_data=d, form_submitted_date=s) for i, d, s in rows]
+        self._position = 0
+
+    def fetchmany(self, size: int) -> list:
+        batch = self._rows[self._position:self._position + size]
+        self._position += size
+
+        return batch
+
+
+class _MemoryWorkqueue:
+    """Stands in for a Workqueue, serializing each added item like the client would."""
+
+    id = 0
+    name = "benchmark"
+
+    def __init__(self):
+        self.items: list[tuple[str, str]] = []
+
+    def add_item(self, data: dict, reference: str):
+        self.items.append((reference, json.dumps(data, ensure_ascii=False)))
+
+
+def _stage_fetch_decode(rows: list[tuple]) -> tuple[list, dict]:
+    result = _FakeResult(rows)
+    decoded = [
+        row
+        for batch in helper_functions._fetch_raw_batches(result, config.DB_FETCH_BATCH_SIZE)
+        for row in helper_functions.decode_forms(batch)
+    ]
+
+    return decoded, {"rows": len(decoded)}
+
+
+def _stage_date_filter(decoded: list) -> tuple[list, dict]:
+    start = WEEK_START
+    end = WEEK_START + datetime.timedelta(days=6)
+    forms = [form for _, _, form in decoded if queue_handler._completed_between(form, start, end)]
+
+    return forms, {"rows": len(forms)}
+
+
+def _stage_transform(forms: list) -> tuple[list, dict]:
+    mapping = config.MODERSMAAL_CONFIG["formular_mapping"]
+    submissions = helper_functions.transform_columnar(forms, mapping).to_dict(orient="records")
+
+    return submissions, {"rows": len(submissions)}
+
+
+def _stage_excel_build(submissions: list) -> tuple[list, dict]:
+    column_order = list(config.MODERSMAAL_CONFIG["formular_mapping"].values())
+
+    with write_submissions_workbook(submissions, column_order, SHEET_NAME, WORKBOOK_FORMATTING) as excel_file:
+        size = excel_file.seek(0, os.SEEK_END)
+
+    return submissions, {"rows": len(submissions), "bytes": size}
+
+
+def _stage_queue_serialize(submissions: list) -> tuple[list, dict]:
+    item = {"reference": "benchmark", "data": {"config": {}, "submissions": submissions}}
+    body = json.dumps({"item": item}, ensure_ascii=False)
+
+    return submissions, {"rows": len(submissions), "bytes": len(body.encode("utf-8"))}
+
+
+def _stage_queue_insert(submissions: list) -> tuple[list, dict]:
+    shards = queue_handler.shard_submissions(submissions, "size", config.SHARD_SIZE)
+    items = [
+        {"reference": f"benchmark_{key}", "data": {"config": {}, "submissions": rows}}
+        for key, rows in shards
+    ]
+
+    workqueue = _MemoryWorkqueue()
+    asyncio.run(queue_handler.concurrent_add(workqueue, items))
+
+    return submissions, {"rows": len(submissions), "items": len(workqueue.items), "bytes": sum(len(body) for _, body in workqueue.items)}
+
+
+STAGES = [
+    ("fetch_decode", _stage_fetch_decode),
+    ("date_filter", _stage_date_filter),
+    ("transform", _stage_transform),
+    ("excel_build", _stage_excel_build),
+    ("queue_serialize", _stage_queue_serialize),
+    ("queue_insert", _stage_queue_insert),
+]
+
+
+def _run_stages(rows: list[tuple], trace: bool) -> dict[str, dict]:
+    """Run all stages on the generated rows, measuring time or, when tracing, peak memory."""
+    helper_functions._clean_string.cache_clear()
+
+    measurements = {}
+    data = rows
+
+    for name, stage in STAGES:
+        if trace:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            data, counts = stage(data)
+            measurements[name] = {"peak_bytes": tracemalloc.get_traced_memory()[1] - baseline, **counts}
+
+        else:
+            start = time.perf_counter()
+            data, counts = stage(data)
+            measurements[name] = {"seconds": time.perf_counter() - start, **counts}
+
+    return measurements
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: list[dict], baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = {(r["size"], r["stage"]): r for r in json.load(baseline_file)["results"]}
+
+    print(f"\nCompared with {baseline_path} (new / old)")
+
+    for result in results:
+        old = baseline.get((result["size"], result["stage"]))
+
+        if old is None:
+            continue
+
+        time_ratio = result["seconds"] / old["seconds"] if old["seconds"] else float("nan")
+        memory_ratio = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("nan")
+
+        print(f"{result['size']:>8}  {result['stage']:<16} time {time_ratio:>6.2f}x  memory {memory_ratio:>6.2f}x")
+
+
+def main():
+    """Run the stages at each size, print a table and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results file, by default a new file in benchmarks/results")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    results = []
+
+    print(f"{'size':>8}  {'stage':<16} {'wall':>9} {'peak traced':>12} {'rows out':>9}")
+
+    for size in args.sizes:
+        rows = synthetic_forms.generate_rows(size, seed=args.seed, week_start=WEEK_START)
+
+        timings = _run_stages(rows, trace=False)
+
+        tracemalloc.start()
+        try:
+            memory = _run_stages(rows, trace=True)
+
+        finally:
+            tracemalloc.stop()
+
+        for name, _ in STAGES:
+            result = {"size": size, "stage": name, **timings[name], "peak_bytes": memory[name]["peak_bytes"]}
+            results.append(result)
+
+            print(
+                f"{size:>8}  {name:<16} {result['seconds']:>8.3f}s {result['peak_bytes'] / 1e6:>10.1f}MB "
+                f"{result['rows']:>9}"
+            )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "sizes": list(args.sizes),
+            "config": {
+                "DB_FETCH_BATCH_SIZE": config.DB_FETCH_BATCH_SIZE,
+                "SHARD_SIZE": config.SHARD_SIZE,
+                "QUEUE_ORDERING": config.QUEUE_ORDERING,
+            },
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_FOLDER, f"stages-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+In-process stand-in for the Automation Server, for load-testing the queue paths without a live server.
+
+FakeATSServer serves the workqueue routes the process uses over HTTP/1.1 with keep-alive, from an
+asyncio loop on a background thread:
+
+    GET  /workqueues/<id>                     the workqueue, for AutomationServer.workqueue()
+    GET  /workqueues/<id>/items?page=&size=   items oldest first, pages from 1, {"items": [...]}
+    POST /workqueues/<id>/add                 {"data": ..., "reference": ...}, adds a new item
+    POST /workqueues/<id>/next_item           claims the oldest new item, 204 when there is none
+    PUT  /workitems/<id>/status               {"status": ..., "message": ...}
+
+Each request can be delayed, failed with a 500 or throttled with a 429 and Retry-After, at
+configurable rates and for chosen routes. The server records the latency of every request.
+Requests without the bearer token are refused with 401, and requests for any other route with
+404, and both are kept in rejected, so a client that speaks a different protocol shows up there.
+
+client_workqueue returns automation_server_client's own Workqueue for a workqueue on the server,
+configured from the environment like main.py, so the routes above are exercised by the real
+client. Where the library is not installed, FakeWorkqueue and FakeWorkItem mirror the parts of
+its Workqueue and WorkItem the process uses: id, name, add_item, iterating to claim items, and
+complete, fail and pending_user inside a with block. The protocol is then not checked.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from automation_server_client import AutomationServer
+
+except ImportError:  # without it the benchmarks use FakeWorkqueue, and the protocol is not checked
+    AutomationServer = None
+
+_WORKQUEUE_ROUTE = re.compile(r"/workqueues/(\d+)")
+_ITEMS_ROUTE = re.compile(r"/workqueues/(\d+)/items")
+_ADD_ROUTE = re.compile(r"/workqueues/(\d+)/add")
+_NEXT_ITEM_ROUTE = re.compile(r"/workqueues/(\d+)/next_item")
+_STATUS_ROUTE = re.compile(r"/workitems/(\d+)/status")
+
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+@dataclass
+class FaultConfig:
+    """Latency and failures injected by the stand-in server"""
+
+    latency: float = 0.0  # seconds added to every request
+    jitter: float = 0.0  # up to this many seconds more, at random
+    error_rate: float = 0.0  # share of requests answered with 500
+    throttle_rate: float = 0.0  # share of requests answered with 429
+    retry_after: float = 1.0  # seconds, sent with every 429
+    routes: set[str] = field(default_factory=lambda: {"add"})  # routes that fail or throttle: items, add, next_item, status
+
+
+class FakeATSServer:
+    """
+    The stand-in server, as a context manager. Workqueue items live in memory, per workqueue id.
+    The loop runs in this process, so it shares the interpreter with the code under test.
+    """
+
+    def __init__(self, faults: FaultConfig | None = None, seed: int = 42, token: str = "benchmark"):
+        self.faults = faults or FaultConfig()
+        self.token = token
+        self.rejected: list[tuple[str, str, int]] = []  # (method, target, status) of refused requests
+        self.items: dict[int, dict] = {}
+        self.workqueues: dict[int, list[int]] = defaultdict(list)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.responses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+        self._rng = random.Random(seed)
+        self._next_id = 1
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self.url: str | None = None
+
+    def __enter__(self) -> "FakeATSServer":
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-ats", daemon=True)
+        self._thread.start()
+
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle_connection, "127.0.0.1", 0, backlog=1024),
+            self._loop,
+        ).result()
+
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        async def close():
+            self._server.close()
+
+            # wait_closed waits for every connection, and clients keep theirs alive
+            for writer in list(self._writers):
+                writer.close()
+
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def seed_items(self, workqueue_id: int, count: int, status: str = "completed") -> None:
+        """Put count items straight into the workqueue, as if added by earlier runs."""
+        for index in range(count):
+            self._add(workqueue_id, {"item": {"reference": f"seed_{index:06d}", "data": {}}}, f"seed_{index:06d}", status)
+
+    def status_counts(self, workqueue_id: int) -> dict[str, int]:
+        """Number of items in the workqueue per status."""
+        counts: dict[str, int] = defaultdict(int)
+
+        for item_id in self.workqueues[workqueue_id]:
+            counts[self.items[item_id]["status"]] += 1
+
+        return dict(counts)
+
+    def reset_stats(self) -> None:
+        """Forget the recorded latencies and response counts."""
+        self.latencies.clear()
+        self.responses.clear()
+
+    def _add(self, workqueue_id: int, data, reference: str, status: str = "new") -> dict:
+        item = {
+            "id": self._next_id,
+            "workqueue_id": workqueue_id,
+            "reference": reference,
+            "data": data,
+            "status": status,
+            "message": "",
+            "created_at": time.time(),
+        }
+
+        self.items[item["id"]] = item
+        self.workqueues[workqueue_id].append(item["id"])
+        self._next_id += 1
+
+        return item
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+
+        try:
+            while request_line := await reader.readline():
+                start = time.perf_counter()
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if headers.get("authorization") != f"Bearer {self.token}":
+                    route, status, payload, extra_headers = "unauthorized", 401, {"detail": "Not authenticated"}, {}
+
+                else:
+                    route, status, payload, extra_headers = await self._respond(method, target, body)
+
+                if status in (400, 401) or route == "unknown":
+                    self.rejected.append((method, target, status))
+
+                content = b"" if payload is None else json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(content)}\r\n"
+                head += "".join(f"{name}: {value}\r\n" for name, value in extra_headers.items())
+
+                writer.write(head.encode() + b"\r\n" + content)
+                await writer.drain()
+
+                self.latencies[route].append(time.perf_counter() - start)
+                self.responses[route][status] += 1
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, method: str, target: str, body: bytes) -> tuple[str, int, dict | None, dict]:
+        url = urllib.parse.urlsplit(target)
+        route, handler, match = self._route(method, url.path)
+
+        if handler is None:
+            return route, 404, {"detail": "Not found"}, {}
+
+        faults = self.faults
+        delay = faults.latency + (self._rng.random() * faults.jitter if faults.jitter else 0.0)
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        if route in faults.routes:
+            roll = self._rng.random()
+
+            if roll < faults.throttle_rate:
+                return route, 429, {"detail": "Too many requests"}, {"Retry-After": f"{faults.retry_after:g}"}
+
+            if roll < faults.throttle_rate + faults.error_rate:
+                return route, 500, {"detail": "Injected error"}, {}
+
+        status, payload = handler(int(match.group(1)), urllib.parse.parse_qs(url.query), json.loads(body) if body else None)
+
+        return route, status, payload, {}
+
+    def _route(self, method: str, path: str):
+        for route, route_method, pattern, handler in (
+            ("workqueue", "GET", _WORKQUEUE_ROUTE, self._get_workqueue),
+            ("items", "GET", _ITEMS_ROUTE, self._list_items),
+            ("add", "POST", _ADD_ROUTE, self._add_item),
+            ("next_item", "POST", _NEXT_ITEM_ROUTE, self._claim_item),
+            ("status", "PUT", _STATUS_ROUTE, self._set_status),
+        ):
+            match = pattern.fullmatch(path)
+
+            if match and method == route_method:
+                return route, handler, match
+
+        return "unknown", None, None
+
+    def _get_workqueue(self, workqueue_id: int, _query, _body) -> tuple[int, dict]:
+        return 200, {"id": workqueue_id, "name": f"fake-workqueue-{workqueue_id}", "description": "", "enabled": True}
+
+    def _list_items(self, workqueue_id: int, query: dict, _body) -> tuple[int, dict]:
+        page = int(query.get("page", ["1"])[0])
+        size = int(query.get("size", ["50"])[0])
+        item_ids = self.workqueues[workqueue_id][(page - 1) * size:page * size]
+
+        return 200, {"items": [self.items[item_id] for item_id in item_ids], "page": page, "size": size}
+
+    def _add_item(self, workqueue_id: int, _query, body: dict) -> tuple[int, dict]:
+        if not body or "reference" not in body:
+            return 400, {"detail": "reference is required"}
+
+        return 200, self._add(workqueue_id, body.get("data"), body["reference"])
+
+    def _claim_item(self, workqueue_id: int, _query, _body) -> tuple[int, dict | None]:
+        for item_id in self.workqueues[workqueue_id]:
+            item = self.items[item_id]
+
+            if item["status"] == "new":
+                item["status"] = "in progress"
+                item["claimed_at"] = time.time()
+
+                return 200, item
+
+        return 204, None
+
+    def _set_status(self, item_id: int, _query, body: dict) -> tuple[int, dict]:
+        item = self.items.get(item_id)
+
+        if item is None:
+            return 404, {"detail": "Work item not found"}
+
+        item["status"] = body["status"]
+        item["message"] = body.get("message", "")
+        item["finished_at"] = time.time()
+
+        return 200, item
+
+
+class FakeWorkItem:
+    """A claimed work item, like automation_server_client.WorkItem"""
+
+    def __init__(self, workqueue: "FakeWorkqueue", item: dict):
+        self._workqueue = workqueue
+        self.id = item["id"]
+        self.reference = item["reference"]
+        self.data = item["data"]
+        self.status = item["status"]
+
+    def __enter__(self) -> "FakeWorkItem":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.status == "in progress":
+            self.fail(str(exc))
+
+        return False
+
+    def complete(self, message: str = ""):
+        """Mark the item completed."""
+        self._set_status("completed", message)
+
+    def fail(self, message: str = ""):
+        """Mark the item failed."""
+        self._set_status("failed", message)
+
+    def pending_user(self, message: str = ""):
+        """Mark the item as waiting for a user."""
+        self._set_status("pending user action", message)
+
+    def _set_status(self, status: str, message: str):
+        response = self._workqueue.http.put(
+            f"{self._workqueue.url}/workitems/{self.id}/status",
+            json={"status": status, "message": message},
+            headers=self._workqueue.headers,
+            timeout=60,
+        )
+        response.raise_for_status()
+
+        self.status = status
+
+
+class FakeWorkqueue:
+    """A workqueue on the stand-in server, like automation_server_client.Workqueue"""
+
+    def __init__(self, url: str, workqueue_id: int = 1, name: str = "fake-workqueue", pool_size: int = 64, token: str = "benchmark"):
+        self.url = url
+        self.id = workqueue_id
+        self.name = name
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+        # Shared by the worker threads, so keep a connection for each of them
+        self.http = requests.Session()
+        self.http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def add_item(self, data: dict, reference: str):
+        """Add an item with a blocking request."""
+        response = self.http.post(
+            f"{self.url}/workqueues/{self.id}/add",
+            json={"data": data, "reference": reference},
+            headers=self.headers,
+            timeout=60,
+        )
+        response.raise_for_status()
+
+    def __iter__(self) -> "FakeWorkqueue":
+        return self
+
+    def __next__(self) -> FakeWorkItem:
+        response = self.http.post(f"{self.url}/workqueues/{self.id}/next_item", headers=self.headers, timeout=60)
+        response.raise_for_status()
+
+        if response.status_code == 204:
+            raise StopIteration
+
+        return FakeWorkItem(self, response.json())
+
+
+def client_workqueue(server: FakeATSServer, workqueue_id: int):
+    """
+    Return automation_server_client's Workqueue for the workqueue on the server, created through
+    AutomationServer.from_environment like main.py, or None when the library is not installed.
+    Sets ATS_URL, ATS_TOKEN and ATS_WORKQUEUE_OVERRIDE for it.
+    """
+    if not hasattr(AutomationServer, "from_environment"):
+        return None
+
+    os.environ["ATS_URL"] = server.url
+    os.environ["ATS_TOKEN"] = server.token
+    os.environ["ATS_WORKQUEUE_OVERRIDE"] = str(workqueue_id)
+
+    return AutomationServer.from_environment().workqueue()
+
+
+def percentiles(values: list[float], points=(50, 95, 99)) -> dict[str, float]:
+    """Nearest-rank percentiles of the values, as {"p50": ..., ...}."""
+    if not values:
+        return {f"p{point}": 0.0 for point in points}
+
+    ordered = sorted(values)
+
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
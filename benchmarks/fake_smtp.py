@@ -0,0 +1,150 @@
+"""
+In-process SMTP stand-in for trying the error emails without a mail server.
+
+FakeSMTPServer accepts plain SMTP (no STARTTLS) from an asyncio loop on a background thread and
+keeps every message it receives, parsed, in messages.
+
+Run from the repository root to send a burst of identical ProcessErrors through
+error_handling.send_error_email, with the mailer pointed at the stand-in:
+    python -m benchmarks.fake_smtp [--errors 50] [--batch-seconds 1] [--min-interval 5]
+"""
+
+import argparse
+import asyncio
+import email
+import email.policy
+import threading
+import time
+from email.message import EmailMessage
+
+from mbu_rpa_core.exceptions import ProcessError
+
+from processes import error_handling
+
+
+class FakeSMTPServer:
+    """The stand-in server, as a context manager"""
+
+    def __init__(self):
+        self.messages: list[EmailMessage] = []
+        self.sessions = 0
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self.host = "127.0.0.1"
+        self.port: int | None = None
+
+    def __enter__(self) -> "FakeSMTPServer":
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-smtp", daemon=True)
+        self._thread.start()
+
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle_connection, self.host, 0),
+            self._loop,
+        ).result()
+
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.sessions += 1
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        try:
+            await reply("220 fake-smtp ready")
+
+            while command_line := await reader.readline():
+                command = command_line.decode().strip().split(" ", 1)[0].upper()
+
+                if command == "EHLO":
+                    await reply("250-fake-smtp")
+                    await reply("250 8BITMIME")
+
+                elif command in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+
+                    lines = []
+
+                    while (line := await reader.readline()) not in (b".\r\n", b""):
+                        # Dot-stuffed lines start with an extra dot
+                        lines.append(line[1:] if line.startswith(b"..") else line)
+
+                    self.messages.append(email.message_from_bytes(b"".join(lines), policy=email.policy.default))
+                    await reply("250 OK: queued")
+
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+
+                else:
+                    await reply("502 Command not implemented")
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+
+def main():
+    """Send a burst of identical errors and report how many mails reached the stand-in."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--errors", type=int, default=50)
+    parser.add_argument("--batch-seconds", type=float, default=1.0)
+    parser.add_argument("--min-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with FakeSMTPServer() as server:
+        settings = error_handling.EmailSettings(
+            recipient="rpa@example.dk",
+            sender="robot@example.dk",
+            smtp_server=server.host,
+            smtp_port=server.port,
+            starttls=False,
+        )
+
+        error_handling.close_error_mailer()
+        error_handling._MAILER = error_handling.ErrorMailer(settings, args.batch_seconds, args.min_interval)
+
+        start = time.perf_counter()
+
+        for _ in range(args.errors):
+            try:
+                raise ProcessError("Simulated failure")
+
+            except ProcessError as e:
+                error_handling.send_error_email(e, add_screenshot=False, process_name="fake-smtp")
+
+        queued = time.perf_counter() - start
+
+        error_handling.close_error_mailer()
+        sent = time.perf_counter() - start
+
+    print(f"{args.errors} errors queued in {queued * 1000:.1f} ms, all mail sent after {sent:.2f}s")
+    print(f"{len(server.messages)} mails in {server.sessions} SMTP sessions")
+
+    for message in server.messages:
+        print(f"  {message['subject']}")
+
+
+if __name__ == "__main__":
+    main()
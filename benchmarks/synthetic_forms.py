@@ -0,0 +1,145 @@
+"""
+Seeded generator of synthetic OS2 "modersmaal" submissions, shaped like the rows of
+[RPA].[journalizing].view_Journalizing: (form_id, form_data JSON, form_submitted_date).
+
+The form_data follows the formular mapping in helpers/config.py, with the quirks the
+transform has to handle: entity serial/created/completed as lists of {"value": ...},
+list-encoded strings, checkbox lists, multiline text, missing and empty fields,
+unfinished submissions and purged rows.
+"""
+
+import json
+import random
+from datetime import date, datetime, time, timedelta
+
+from helpers import config
+
+FORM_TYPE = config.MODERSMAAL_CONFIG["os2_webform_id"]
+
+PURGED_SHARE = 0.03  # rows whose form_data is purged
+UNFINISHED_SHARE = 0.02  # rows without a completed timestamp
+OUTSIDE_WEEK_SHARE = 0.3  # rows completed outside the target week
+
+LANGUAGES = [
+    "Arabisk", "Somali", "Tigrinya", "Dari", "Pashto", "Farsi", "Kurdisk (kurmanji)", "Kurdisk (sorani)",
+    "Tyrkisk", "Ukrainsk", "Polsk", "Rumænsk", "Vietnamesisk", "Tamil", "Urdu", "Bosnisk",
+]
+SCHOOLS = [
+    ("751", "Ellekærskolen"), ("752", "Skjoldhøjskolen"), ("753", "Frydenlundskolen"), ("754", "Tilst Skole"),
+    ("755", "Vestergårdsskolen"), ("756", "Bakkegårdsskolen"), ("757", "Søndervangskolen"), ("758", "Rundhøjskolen"),
+]
+FIRST_NAMES = ["Amina", "Yusuf", "Fatima", "Omar", "Leyla", "Hassan", "Sofia", "Ali", "Mariam", "Ahmad", "Olena", "Mehmet"]
+LAST_NAMES = ["Hussein", "Ahmed", "Mohamed", "Yilmaz", "Kovalenko", "Nguyen", "Rahimi", "Hassan", "Abdi", "Nowak"]
+STREETS = ["Søndergade", "Gudrunsvej", "Hasle Ringvej", "Edwin Rahrs Vej", "Tovshøjvej", "Bispehavevej", "Janesvej"]
+CITIZENSHIPS = ["Dansk", "Somalisk", "Syrisk", "Afghansk", "Tyrkisk", "Ukrainsk", "Irakisk", "Eritreisk"]
+
+
+def generate_rows(count: int, seed: int = 42, week_start: date = date(2025, 9, 15)) -> list[tuple[int, str, datetime]]:
+    """
+    Generate count (form_id, form_data JSON, form_submitted_date) rows, newest submission first
+    like the database query. Most rows are completed in the week starting week_start.
+    """
+    rng = random.Random(seed)
+    rows = []
+
+    for index in range(count):
+        form_id = 1_000_000 + index
+
+        if rng.random() < OUTSIDE_WEEK_SHARE:
+            day = week_start + timedelta(days=rng.choice([-14, -8, -1, 7, 8]))
+
+        else:
+            day = week_start + timedelta(days=rng.randrange(7))
+
+        completed = datetime.combine(day, time(rng.randrange(24), rng.randrange(60), rng.randrange(60)))
+        created = completed - timedelta(minutes=rng.randrange(2, 90))
+
+        if rng.random() < PURGED_SHARE:
+            form_data = {"purged": completed.isoformat()}
+
+        else:
+            form_data = generate_form_data(rng, serial=index + 1, created=created, completed=completed)
+
+        rows.append((form_id, json.dumps(form_data, ensure_ascii=False), created))
+
+    rows.sort(key=lambda row: row[2], reverse=True)
+
+    return rows
+
+
+def generate_form_data(rng: random.Random, serial: int, created: datetime, completed: datetime) -> dict:
+    """One submission's form_data: the answers under "data" and the OS2 entity fields."""
+    school_number, school = rng.choice(SCHOOLS)
+    manual_child = rng.random() < 0.1
+
+    data = {
+        "elevens_navn_mitid": "" if manual_child else _name(rng),
+        "elevens_cpr_nummer_mitid": "" if manual_child else _cpr(rng),
+        "elevens_adresse_mitid": "" if manual_child else _address(rng, multiline=rng.random() < 0.3),
+        "mit_barn_kommer_ikke_frem_i_listen": ["Mit barn kommer ikke frem i listen"] if manual_child else [],
+        "klassetrin": f"{rng.randrange(10)}. klasse",
+        "hvilken_type_skole_gaar_dit_barn_paa": rng.choice(["Folkeskole", "Privatskole", "Friskole"]),
+        "skole_kommunal_api": school_number,
+        "skole": school,
+        "oensket_sprog": _language(rng),
+        "har_eleven_tidligere_modtaget_modersmaalsundervisning_": rng.choice(["Ja", "Nej"]),
+        "navn_foraeldre_01": _name(rng),
+        "cpr_nummer_foraeldre_01": _cpr(rng),
+        "adresse_foraeldre_01": _address(rng, multiline=rng.random() < 0.3),
+        "kommunekode": "751",
+        "foraeldres_e_mail": f"foraelder{serial}@example.dk",
+        "telefonnummer_foraelder": f"+45 {rng.randrange(20_000_000, 99_999_999)}",
+        "statsborgerskab": rng.choice(CITIZENSHIPS),
+    }
+
+    if manual_child:
+        data["elevens_navn"] = _name(rng)
+        data["cpr_elevens_nummer"] = _cpr(rng)
+        data["elevens_adresse"] = _address(rng, multiline=True)
+
+    if data["har_eleven_tidligere_modtaget_modersmaalsundervisning_"] == "Ja":
+        data["hvis_ja_antal_aar_01"] = str(rng.randrange(1, 6))
+
+    if rng.random() < 0.6:
+        data["navn_foraeldre_02"] = _name(rng)
+        data["e_mail_foraelder_02"] = f"medforaelder{serial}@example.dk"
+        data["telefonnummer_foraelder_02"] = f"{rng.randrange(20_000_000, 99_999_999)}"
+        data["statsborgerskab_medforaelder"] = rng.choice(CITIZENSHIPS)
+
+    unfinished = rng.random() < UNFINISHED_SHARE
+
+    entity = {
+        "uuid": [{"value": f"{rng.getrandbits(128):032x}"}],
+        "serial": [{"value": serial}],
+        "created": [{"value": created.isoformat()}],
+        "completed": [{"value": None if unfinished else completed.isoformat()}],
+        "webform_id": [{"target_id": FORM_TYPE}],
+    }
+
+    return {"data": data, "entity": entity}
+
+
+def _language(rng: random.Random):
+    roll = rng.random()
+
+    if roll < 0.1:
+        return str(rng.sample(LANGUAGES, 2))  # list-encoded string, e.g. "['Arabisk', 'Somali']"
+
+    if roll < 0.15:
+        return rng.sample(LANGUAGES, 2)  # an actual list
+
+    return rng.choice(LANGUAGES)
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _cpr(rng: random.Random) -> str:
+    return f"{rng.randrange(1, 29):02d}{rng.randrange(1, 13):02d}{rng.randrange(0, 100):02d}{rng.randrange(10_000):04d}"
+
+
+def _address(rng: random.Random, multiline: bool) -> str:
+    separator = "\r\n" if multiline else ", "
+
+    return f"{rng.choice(STREETS)} {rng.randrange(1, 200)}{separator}8{rng.randrange(200, 400)} Aarhus"
@@ -0,0 +1,114 @@
+"""Adaptive concurrency limit for requests to the Automation Server"""
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts by additive increase, multiplicative decrease (AIMD).
+
+    Each success with a latency under the target raises the limit by 1 / limit, so by
+    about one per round of requests. A slow success, an error or a throttling response
+    multiplies the limit by decrease_factor, once per round: requests that started before
+    the last decrease do not decrease it again. A Retry-After delay also holds back all new
+    requests until it has passed.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float,
+        maximum: float,
+        latency_target: float,
+        decrease_factor: float = 0.5,
+    ):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.peak = self.limit
+
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=pause)
+
+                    except TimeoutError:
+                        pass
+
+                elif self._in_flight >= max(int(self.limit), 1):
+                    await self._condition.wait()
+
+                else:
+                    break
+
+            self._in_flight += 1
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._in_flight -= 1
+
+            # Only wake as many waiters as there are free slots, not every queued request
+            self._condition.notify(max(int(self.limit), 1) - self._in_flight)
+
+    def record_success(self, started: float):
+        """Grow the limit after a healthy request, shrink it after a slow one. started is from time.monotonic()."""
+        if time.monotonic() - started <= self.latency_target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.peak = max(self.peak, self.limit)
+
+        else:
+            self._decrease(started)
+
+    def record_failure(self, started: float, retry_after: float | None = None):
+        """Shrink the limit after an error, and hold back new requests for retry_after seconds."""
+        self._decrease(started)
+
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def _decrease(self, started: float):
+        if started < self._last_decrease:
+            return
+
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        self._last_decrease = time.monotonic()
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """Read the Retry-After delay in seconds from an HTTP error's response, or None if it has none."""
+    response = getattr(error, "response", None)
+
+    if response is None:
+        return None
+
+    header = response.headers.get("Retry-After")
+
+    if not header:
+        return None
+
+    try:
+        return max(float(header), 0.0)
+
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(header).timestamp() - time.time(), 0.0)
+
+    except (TypeError, ValueError):
+        return None
@@ -2,10 +2,19 @@
 
 import logging
 import os
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from automation_server_client import WorkItem, Workqueue
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from helpers import config, metrics
+
+load_dotenv()  # Loads variables from .env
+
+_SESSION: requests.Session | None = None
 
 
 def get_workqueue_items(workqueue: Workqueue):
@@ -13,40 +22,72 @@ def get_workqueue_items(workqueue: Workqueue):
     Retrieve items from the specified workqueue.
     If the queue is empty, return an empty list.
     """
-    load_dotenv()
+    workqueue_items = set()
+
+    for res_json in iter_workqueue_pages(workqueue):
+        for row in res_json:
+            ref = row.get("reference")
+            if ref:
+                workqueue_items.add(ref)
 
+    return workqueue_items
+
+
+def iter_workqueue_pages(workqueue: Workqueue, first_page: int = 1) -> Iterator[list[dict]]:
+    """
+    Yield the item pages of the workqueue in order, starting from first_page.
+
+    Pages are fetched concurrently, ATS_PAGE_CONCURRENCY at a time, over a shared
+    keep-alive session, until a window contains an empty page.
+    """
     url = os.getenv("ATS_URL")
     token = os.getenv("ATS_TOKEN")
 
-    workqueue_items = set()
-
     if not url or not token:
         raise EnvironmentError("ATS_URL or ATS_TOKEN is not set in the environment")
 
     headers = {"Authorization": f"Bearer {token}"}
+    items_url = f"{url}/workqueues/{workqueue.id}/items"
+    session = _get_session()
+
+    def fetch_page(page: int) -> list[dict]:
+        response = session.get(
+            items_url,
+            params={"page": page, "size": config.ATS_PAGE_SIZE},
+            headers=headers,
+            timeout=60,
+        )
+        response.raise_for_status()
 
-    workqueue_items = set()
-    page = 1
-    size = 200  # max allowed
+        return response.json().get("items", [])
 
-    while True:
-        full_url = f"{url}/workqueues/{workqueue.id}/items?page={page}&size={size}"
-        response = requests.get(full_url, headers=headers, timeout=60)
-        response.raise_for_status()
+    with ThreadPoolExecutor(max_workers=config.ATS_PAGE_CONCURRENCY) as executor:
+        while True:
+            pages = range(first_page, first_page + config.ATS_PAGE_CONCURRENCY)
+            results = list(executor.map(fetch_page, pages))
 
-        res_json = response.json().get("items", [])
+            for res_json in results:
+                if not res_json:
+                    return
 
-        if not res_json:
-            break
+                yield res_json
 
-        for row in res_json:
-            ref = row.get("reference")
-            if ref:
-                workqueue_items.add(ref)
+            first_page += config.ATS_PAGE_CONCURRENCY
 
-        page += 1
 
-    return workqueue_items
+def _get_session() -> requests.Session:
+    """Return the shared session for Automation Server requests, with a connection per concurrent page."""
+    global _SESSION  # pylint: disable=global-statement
+
+    if _SESSION is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=config.ATS_PAGE_CONCURRENCY)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        _SESSION = session
+
+    return _SESSION
 
 
 def get_item_info(item: WorkItem):
@@ -55,9 +96,25 @@ def get_item_info(item: WorkItem):
 
 
 def init_logger():
-    """Initialize the root logger with JSON formatting."""
+    """
+    Initialize the root logger with plain text formatting, and the stage metrics logger
+    with one JSON object per line, to config.METRICS_LOG_PATH or stderr.
+    """
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(module)s.%(funcName)s:%(lineno)d — %(message)s",
         datefmt="%H:%M:%S",
     )
+
+    if config.METRICS_LOG_PATH:
+        handler = logging.FileHandler(config.METRICS_LOG_PATH, encoding="utf-8")
+
+    else:
+        handler = logging.StreamHandler()
+
+    handler.setFormatter(metrics.JsonFormatter())
+
+    metrics_logger = logging.getLogger(metrics.__name__)
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
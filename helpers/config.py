@@ -4,13 +4,70 @@
 # Workqueue settings
 # ----------------------
 MAX_RETRY = 1
+PROCESS_WORKERS = 1  # work items processed at the same time, 1 processes them one by one
+SHAREPOINT_CLIENT_MAX_AGE = 2700  # seconds an authenticated Sharepoint client is reused, below the 60 minute token lifetime
+FOLDER_LISTING_CACHE_TTL = 300  # seconds a SharePoint folder listing is reused when a file lookup by path fails
 
 # ----------------------
 # Queue population settings
 # ----------------------
-MAX_CONCURRENCY = 10  # tune based on backend capacity
-MAX_RETRIES = 1  # failure retries per item
+ATS_PAGE_SIZE = 200  # workqueue items per page, the maximum the API allows
+ATS_PAGE_CONCURRENCY = 4  # workqueue pages fetched at the same time
+REFERENCE_INDEX_PATH = ".cache/workqueue_references.sqlite3"  # local index of queued references, None to list the whole workqueue every run
+INITIAL_CONCURRENCY = 2  # concurrent inserts to start from, adapted while adding
+MAX_CONCURRENCY = 32  # upper bound for the adaptive insert concurrency
+ADD_LATENCY_TARGET = 2.0  # seconds, slower inserts make the concurrency back off
+MAX_RETRIES = 3  # attempts per item
 RETRY_BASE_DELAY = 0.5  # seconds
+QUEUE_ORDERING = "reference"  # order of new items: "reference", "content_hash" or "none"
+SUBMISSION_WINDOW_MARGIN_DAYS = 1  # padding around last week when querying the database
+# The submission cache keeps transformed submissions, with CPR numbers, names and addresses, unencrypted in
+# an SQLite file at this path, relative to the working directory. Each run keeps only rows submitted from
+# SUBMISSION_WINDOW_MARGIN_DAYS before last week's monday, and drops submissions purged in the database.
+SUBMISSION_CACHE_PATH = None  # opt-in, e.g. ".cache/submissions.sqlite3", None queries the database directly
+SHARD_BY = None  # split the week into work items: "language", "size", or None for one work item
+SHARD_SIZE = 500  # submissions per work item when sharding by size
+
+# ----------------------
+# Database settings
+# ----------------------
+DB_FETCH_BATCH_SIZE = 500  # rows fetched from the cursor at a time
+DB_POOL_SIZE = 2  # connections kept open per connection string
+DB_MAX_OVERFLOW = 2  # extra connections allowed above the pool size
+DB_POOL_RECYCLE = 1800  # seconds before a pooled connection is replaced
+JSON_DECODE_WORKERS = 0  # processes decoding form_data in parallel, 0 or 1 decodes in-process
+
+# ----------------------
+# Transform settings
+# ----------------------
+CLEAN_VALUE_CACHE_SIZE = 4096  # distinct string values memoized by the value cleaner
+TRANSFORM_PLAN_CACHE_SIZE = 8  # distinct formular mappings whose compiled transform plans are kept
+
+# ----------------------
+# Excel settings
+# ----------------------
+EXCEL_SPOOL_MAX_SIZE = 16 * 1024 * 1024  # bytes of workbook kept in memory before spilling to a temporary file
+EXCEL_FORMAT_LOCALLY = True  # sort and format workbooks before uploading, False formats them remotely after the upload
+UPLOAD_CHUNKED_MIN_SIZE = 4 * 1024 * 1024  # bytes from which workbooks are uploaded in chunks through Graph, None to never
+UPLOAD_CHUNK_SIZE = 10 * 320 * 1024  # bytes per upload request, Graph requires a multiple of 320 KiB
+UPLOAD_MAX_RETRIES = 5  # failed chunk requests in a row before an upload gives up
+
+# ----------------------
+# Error email settings
+# ----------------------
+ERROR_EMAIL_BATCH_SECONDS = 30  # errors arriving this long after the first one are sent in the same mail
+ERROR_EMAIL_MIN_INTERVAL = 300  # seconds between error mails, later errors wait for the next mail
+ERROR_EMAIL_CLOSE_TIMEOUT = 60  # seconds to wait for queued error mails at process exit
+
+# ----------------------
+# Metrics settings
+# ----------------------
+METRICS_LOG_PATH = None  # file the JSON stage metrics are appended to, None writes them to stderr
+MEMORY_PROFILE_FOLDER = ".cache/memory_profiles"  # where --profile-memory writes its reports
+MEMORY_PROFILE_TOP = 10  # allocation sites reported per stage
+MEMORY_PROFILE_FRAMES = 1  # stack frames tracemalloc keeps per allocation
+MEMORY_PROFILE_SNAPSHOT_LIMIT = 3  # occurrences of each stage that get allocation snapshots, later ones only their peaks
+MEMORY_RSS_SAMPLE_INTERVAL = 0.05  # seconds between RSS samples while profiling
 
 # ----------------------
 # Data config setup
@@ -0,0 +1,259 @@
+"""Streaming writer for the submission workbooks uploaded to SharePoint"""
+
+import math
+import re
+import tempfile
+from collections.abc import Iterable
+from typing import Any
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from helpers import config
+
+# The header style pandas 2 gives in to_excel, so the workbook looks the same as before
+_THIN = Side(style="thin")
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+# Sorting keys of this form are column letters, anything else is looked up as a header
+_COLUMN_LETTER = re.compile(r"[A-Z]{1,3}")
+
+
+def write_submissions_workbook(
+    submissions: Iterable[dict],
+    columns: list[str],
+    sheet_name: str,
+    formatting: dict | None = None,
+) -> tempfile.SpooledTemporaryFile:
+    """
+    Write the submissions to a single sheet workbook, one row per submission in the given column order.
+
+    Rows are streamed with openpyxl's write-only mode, so only the current row is held as cells,
+    into a temporary file that stays in memory up to EXCEL_SPOOL_MAX_SIZE bytes and moves to disk
+    beyond that. Missing keys, empty strings and NaN values give empty cells. The file is returned
+    rewound and must be closed by the caller.
+
+    If formatting is given, it takes the keyword arguments of Sharepoint.format_and_sort_excel_file
+    after sheet_name, and the sheet is written sorted and styled the way that method would leave it.
+    Sorting needs all rows at once, so they are then held as lists of values while writing.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+
+    if formatting:
+        _append_formatted_rows(worksheet, submissions, columns, **formatting)
+
+    else:
+        worksheet.append([_header_cell(worksheet, column) for column in columns])
+
+        for submission in submissions:
+            worksheet.append([_cell_value(submission.get(column)) for column in columns])
+
+    # Not a with block, the open file is returned and the caller closes it
+    excel_file = tempfile.SpooledTemporaryFile(max_size=config.EXCEL_SPOOL_MAX_SIZE)  # noqa: SIM115
+
+    try:
+        workbook.save(excel_file)
+
+    except Exception:
+        excel_file.close()
+
+        raise
+
+    excel_file.seek(0)
+
+    return excel_file
+
+
+def sort_rows(rows: list[list], columns: list[str], sorting_keys: list[dict]) -> list[list]:
+    """
+    Sort rows of values like format_and_sort_excel_file does.
+
+    Each sorting key names its column by index, letter (one to three capitals) or header, and may
+    give ascending and a type, "str", "int", "float" or "datetime". Values in a typed column are
+    converted to that type, in the rows too, and values that do not convert sort last. Earlier keys
+    take precedence and ties keep their order.
+    """
+    for item in reversed(sorting_keys):
+        key = item.get("key")
+
+        if isinstance(key, int):
+            index = key
+
+        elif isinstance(key, str) and _COLUMN_LETTER.fullmatch(key):
+            index = column_index_from_string(key) - 1
+
+        else:
+            index = columns.index(key)
+
+        convert = _SORT_CONVERTERS.get(item.get("type"))
+
+        if convert:
+            for row in rows:
+                row[index] = convert(row[index])
+
+        present = [row for row in rows if row[index] is not None]
+        missing = [row for row in rows if row[index] is None]
+
+        present.sort(key=lambda row: row[index], reverse=not item.get("ascending", True))
+
+        rows = present + missing
+
+    return rows
+
+
+def _append_formatted_rows(
+    worksheet,
+    submissions: Iterable[dict],
+    columns: list[str],
+    sorting_keys: list[dict] | None = None,
+    font_config: dict[int, dict] | None = None,
+    bold_rows: list[int] | None = None,
+    italic_rows: list[int] | None = None,
+    align_horizontal: str = "center",
+    align_vertical: str = "center",
+    column_widths: Any = "auto",
+    freeze_panes: str | None = None,
+):
+    rows = [[_cell_value(submission.get(column)) for column in columns] for submission in submissions]
+
+    if sorting_keys:
+        rows = sort_rows(rows, columns, sorting_keys)
+
+    # Column widths fit the longest value plus 2, and an int caps them and wraps the capped columns
+    widths = [len(str(column or "")) for column in columns]
+
+    for row in rows:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value or "")))
+
+    widths = [width + 2 for width in widths]
+    wrapped = [False] * len(columns)
+
+    if isinstance(column_widths, int):
+        for index, width in enumerate(widths):
+            if width > column_widths:
+                widths[index] = column_widths
+                wrapped[index] = True
+
+    elif column_widths not in (None, "auto"):
+        raise ValueError(
+            f"Column width provided with incorrect datatype - datatype int expected, instead column width is of datatype {type(column_widths)}"
+        )
+
+    for index, width in enumerate(widths, start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+
+    if freeze_panes:
+        worksheet.freeze_panes = freeze_panes
+
+    alignments = {
+        wrap: Alignment(horizontal=align_horizontal, vertical=align_vertical, wrap_text=wrap or None)
+        for wrap in (False, True)
+    }
+    styled_cells: dict[Font, list[WriteOnlyCell]] = {}
+
+    for row_index, values in enumerate([columns, *rows], start=1):
+        if font_config and row_index in font_config:
+            row_config = font_config[row_index]
+
+            font = Font(
+                name=row_config.get("name", "Calibri"),
+                size=row_config.get("size", 11),
+                bold=row_config.get("bold", False),
+                italic=row_config.get("italic", False),
+            )
+
+        else:
+            font = Font(
+                bold=row_index in bold_rows if bold_rows else False,
+                italic=row_index in italic_rows if italic_rows else False,
+            )
+
+        # Row heights fit the wrapped text, at 20 points per line
+        if isinstance(column_widths, int):
+            line_count = 1
+
+            for value, width, wrap in zip(values, widths, wrapped):
+                if value and wrap:
+                    chars_per_line = width * 1.2
+                    lines = str(value).split("\n")
+                    line_count = max(line_count, sum(math.ceil(len(line) / chars_per_line) for line in lines))
+
+            worksheet.row_dimensions[row_index].height = line_count * 20
+
+        # A write-only row is written out as it is appended, so its styled cells can be
+        # reused for the next row, which saves looking up the styles cell by cell
+        cells = styled_cells.get(font)
+
+        if cells is None:
+            cells = []
+
+            for wrap in wrapped:
+                cell = WriteOnlyCell(worksheet)
+                cell.font = font
+                cell.alignment = alignments[wrap]
+                cells.append(cell)
+
+            styled_cells[font] = cells
+
+        for cell, value in zip(cells, values):
+            cell.value = value
+
+        worksheet.append(cells)
+
+
+def _header_cell(worksheet, column: str) -> WriteOnlyCell:
+    cell = WriteOnlyCell(worksheet, value=column)
+    cell.font = HEADER_FONT
+    cell.border = HEADER_BORDER
+    cell.alignment = HEADER_ALIGNMENT
+
+    return cell
+
+
+def _to_number(value, integer: bool):
+    if isinstance(value, str):
+        try:
+            value = float(value)
+
+        except ValueError:
+            return None
+
+    if not isinstance(value, (int, float)) or (isinstance(value, float) and math.isnan(value)):
+        return None
+
+    if integer and float(value).is_integer():
+        return int(value)
+
+    return value
+
+
+def _to_datetime(value):
+    if value is None:
+        return None
+
+    parsed = pd.to_datetime(value, dayfirst=True, errors="coerce")
+
+    return None if pd.isna(parsed) else parsed.to_pydatetime()
+
+
+_SORT_CONVERTERS = {
+    "str": lambda value: None if value is None else str(value),
+    "int": lambda value: _to_number(value, integer=True),
+    "float": lambda value: _to_number(value, integer=False),
+    "datetime": _to_datetime,
+}
+
+
+def _cell_value(value):
+    # An empty string is read back from the workbook as an empty cell, so it is written as one
+    if value == "" or (isinstance(value, float) and math.isnan(value)):
+        return None
+
+    return value
@@ -0,0 +1,252 @@
+"""Chunked, resumable uploads to a SharePoint document library through Microsoft Graph upload sessions"""
+
+import logging
+import threading
+import time
+import urllib.parse
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import BinaryIO
+
+import msal
+import requests
+
+from helpers import config
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UploadStats:
+    """Outcome of a chunked upload"""
+
+    size: int
+    seconds: float
+    chunks: int
+    resumes: int
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+class GraphUploader:
+    """
+    Uploads files to the document libraries of SharePoint sites in chunks, over one keep-alive session.
+
+    Authenticates as the app registration with its certificate, like the Sharepoint class, but
+    against Microsoft Graph. The drive id of each document library is looked up once.
+    """
+
+    def __init__(self, tenant: str, client_id: str, thumbprint: str, cert_path: str, site_url: str, site_type: str = "Teams"):
+        with open(cert_path, encoding="utf-8") as cert_file:
+            private_key = cert_file.read()
+
+        self._app = msal.ConfidentialClientApplication(
+            client_id,
+            authority=f"https://login.microsoftonline.com/{tenant}",
+            client_credential={"thumbprint": thumbprint, "private_key": private_key},
+        )
+
+        self.hostname = urllib.parse.urlparse(site_url).hostname
+        self.site_type = site_type
+
+        self._http = requests.Session()
+        self._drive_ids: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def upload(
+        self,
+        file: BinaryIO,
+        size: int,
+        site_name: str,
+        document_library: str,
+        folder_name: str,
+        file_name: str,
+    ) -> UploadStats:
+        """Upload size bytes from the file to the folder, replacing any file of the same name."""
+        drive_id = self._get_drive_id(site_name, document_library)
+        item_path = urllib.parse.quote(f"{folder_name}/{file_name}")
+
+        response = self._http.post(
+            f"{GRAPH_URL}/drives/{drive_id}/root:/{item_path}:/createUploadSession",
+            json={"item": {"@microsoft.graph.conflictBehavior": "replace"}},
+            headers=self._headers(),
+            timeout=60,
+        )
+        response.raise_for_status()
+
+        def file_exists() -> bool:
+            return self._get_file_size(drive_id, item_path) == size
+
+        return upload_in_chunks(self._http, response.json()["uploadUrl"], file, size, file_exists=file_exists)
+
+    def _get_file_size(self, drive_id: str, item_path: str) -> int | None:
+        """Return the size of the file at the path in the drive, or None if it cannot be found."""
+        try:
+            response = self._http.get(
+                f"{GRAPH_URL}/drives/{drive_id}/root:/{item_path}",
+                headers=self._headers(),
+                timeout=60,
+            )
+            response.raise_for_status()
+
+            return response.json().get("size")
+
+        except requests.RequestException as e:
+            logger.warning(f"Could not look up {urllib.parse.unquote(item_path)}: {e}")
+
+            return None
+
+    def _get_drive_id(self, site_name: str, document_library: str) -> str:
+        key = (site_name, document_library)
+
+        with self._lock:
+            if key not in self._drive_ids:
+                response = self._http.get(
+                    f"{GRAPH_URL}/sites/{self.hostname}:/{self.site_type}/{site_name}:/drives",
+                    headers=self._headers(),
+                    timeout=60,
+                )
+                response.raise_for_status()
+
+                # The Sharepoint class names a library by its URL segment, Graph by its display name
+                drive_ids = [
+                    drive["id"]
+                    for drive in response.json()["value"]
+                    if document_library in (drive.get("name"), urllib.parse.unquote(drive.get("webUrl", "")).rstrip("/").rsplit("/", 1)[-1])
+                ]
+
+                if not drive_ids:
+                    raise ValueError(f"Document library {document_library} not found on site {site_name}")
+
+                self._drive_ids[key] = drive_ids[0]
+
+            return self._drive_ids[key]
+
+    def _headers(self) -> dict:
+        # msal caches the token and only requests a new one when it is about to expire
+        result = self._app.acquire_token_for_client(scopes=[GRAPH_SCOPE])
+
+        if "access_token" not in result:
+            raise PermissionError(f"Could not get a Graph token: {result.get('error_description')}")
+
+        return {"Authorization": f"Bearer {result['access_token']}"}
+
+
+def upload_in_chunks(
+    http: requests.Session,
+    upload_url: str,
+    file: BinaryIO,
+    size: int,
+    chunk_size: int = config.UPLOAD_CHUNK_SIZE,
+    max_retries: int = config.UPLOAD_MAX_RETRIES,
+    file_exists: Callable[[], bool] | None = None,
+) -> UploadStats:
+    """
+    Send size bytes from the file to an upload session, chunk_size bytes per request.
+
+    The file is read one chunk at a time from the current offset. After a failed request the
+    session is asked which bytes it still expects, and the upload resumes from there, up to
+    max_retries times in a row. The upload URL carries its own authorization.
+
+    Graph removes a session once the file is complete, so when the status cannot be read after
+    the last chunk was sent, file_exists is asked whether the file arrived before resending it.
+
+    Raises:
+        requests.RequestException: If a chunk still fails after max_retries attempts.
+    """
+    offset = 0
+    chunks = 0
+    resumes = 0
+    failures = 0
+    start = time.perf_counter()
+
+    while True:
+        file.seek(offset)
+        chunk = file.read(min(chunk_size, size - offset))
+        end = offset + len(chunk) - 1
+
+        try:
+            response = http.put(
+                upload_url,
+                data=chunk,
+                headers={"Content-Range": f"bytes {offset}-{end}/{size}"},
+                timeout=120,
+            )
+            response.raise_for_status()
+
+        except requests.RequestException as e:
+            failures += 1
+
+            if failures > max_retries:
+                raise
+
+            delay = config.RETRY_BASE_DELAY * (2 ** (failures - 1))
+            logger.warning(f"Chunk at byte {offset} failed ({failures}/{max_retries}), resuming in {delay:.2f}s: {e}")
+            time.sleep(delay)
+
+            expected = _get_next_expected_offset(http, upload_url)
+            resumes += 1
+
+            if expected is None:
+                # The last chunk may have completed the file, which ends the session
+                if end + 1 >= size and file_exists is not None and file_exists():
+                    break
+
+                logger.warning(f"Could not read the upload session status, resending from byte {offset}")
+
+            else:
+                offset = expected
+
+            # The last chunk arrived even though its response was lost
+            if offset >= size:
+                break
+
+            continue
+
+        chunks += 1
+        failures = 0
+
+        # 200 or 201 carries the finished file, 202 the ranges still expected
+        if response.status_code in (200, 201):
+            break
+
+        offset = _next_offset(response.json(), end + 1)
+
+    stats = UploadStats(size=size, seconds=time.perf_counter() - start, chunks=chunks, resumes=resumes)
+
+    logger.info(
+        f"Uploaded {stats.size / 1e6:.1f} MB in {stats.chunks} chunks and {stats.seconds:.1f}s "
+        f"({stats.throughput / 1e6:.2f} MB/s, {stats.resumes} resumes)"
+    )
+
+    return stats
+
+
+def _get_next_expected_offset(http: requests.Session, upload_url: str) -> int | None:
+    """Ask the upload session where to continue, or return None if its status cannot be read."""
+    try:
+        response = http.get(upload_url, timeout=60)
+        response.raise_for_status()
+
+        return _next_offset(response.json(), None)
+
+    except requests.RequestException as e:
+        logger.warning(f"Could not read the upload session status: {e}")
+
+        return None
+
+
+def _next_offset(status: dict, fallback: int | None) -> int | None:
+    # nextExpectedRanges holds ranges like "26-" or "26-99", the first one starts where to continue
+    ranges = status.get("nextExpectedRanges") or []
+
+    if not ranges:
+        return fallback
+
+    return int(ranges[0].split("-")[0])
@@ -1,18 +1,55 @@
 """Script to upload fetch an OS2-formular submission and upload it in pdf format to Sharepoint."""
 
+import atexit
+
 import json
 
+import threading
+
 import urllib.parse
 
 import ast
 
-from datetime import datetime
+from collections import deque
 
-import requests
+from collections.abc import Callable, Iterable, Iterator
+
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from datetime import date, datetime
+
+from functools import lru_cache
+
+from typing import Any
+
+import numpy as np
 
 import pandas as pd
 
+import requests
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from helpers import config, metrics
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+except ImportError:  # orjson is an optional, faster JSON backend
+    _json_loads = json.loads
+
+_ENGINES: dict[str, Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+_LITERAL_CHARS = frozenset("[]'\"")
+
+_ISO_DATETIME_PATTERN = r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?"
+
+
+TransformStep = tuple[tuple[str, ...], str, Callable[[Any], Any]]
 
 
 def transform_form_submission(form_serial_number: str, form: dict, mapping: dict) -> dict:
@@ -21,22 +58,122 @@ def transform_form_submission(form_serial_number: str, form: dict, mapping: dict
     Supports both flat and nested mappings (e.g., tables of questions).
     """
 
-    transformed = {}
-    form_data = form.get("data", {})
+    transformed = _apply_transform_plan(_get_transform_plan(mapping), form)
+    transformed["Serial number"] = form_serial_number
+
+    return transformed
+
+
+def transform_many(forms: Iterable[dict], mapping: dict) -> list[dict]:
+    """
+    Transforms several form submissions with the same mapping.
+    The mapping is compiled once, and the serial number is read from each form's entity.
+    """
+
+    plan = _get_transform_plan(mapping)
+
+    return [_apply_transform_plan(plan, form) for form in forms]
+
+
+def transform_columnar(forms: Iterable[dict], mapping: dict) -> pd.DataFrame:
+    """
+    Transforms form submissions column by column instead of row by row.
+    Each mapped field is extracted into one column across all forms, after which cleaning
+    and datetime formatting run as vectorized operations on the whole column.
+    Returns a DataFrame with the columns in mapping order and the same values as transform_many.
+    """
+
+    plan = _get_transform_plan(mapping)
+
+    forms = list(forms)
+    roots = {source_path[0] for source_path, _, _ in plan}
+    sections = {root: _extract_column(forms, (root,)) for root in roots}
+
+    columns = {}
+
+    for source_path, output_column, cleaner in plan:
+        values = _extract_column(sections[source_path[0]], source_path[1:])
+
+        if cleaner is _clean_value:
+            columns[output_column] = _clean_column(values)
+
+        elif cleaner is _entity_datetime:
+            columns[output_column] = _entity_datetime_column(values)
+
+        else:
+            columns[output_column] = pd.Series([cleaner(v) for v in values], dtype=object)
+
+    return pd.DataFrame(columns, columns=list(columns))
+
+
+def compile_transform_plan(mapping: dict) -> list[TransformStep]:
+    """
+    Flattens a formular mapping into (source path, output column, cleaner) steps, in output column order.
+    Nested table mappings become one step per nested key, and the entity fields
+    serial, created and completed replace form data columns with the same output name.
+    """
+
+    steps: dict[str, TransformStep] = {}
 
     for source_key, target in mapping.items():
         if isinstance(target, dict):
-            nested_data = form_data.get(source_key, {})
             for nested_key, output_column in target.items():
-                transformed[output_column] = _clean_value(nested_data.get(nested_key))
+                steps[output_column] = (("data", source_key, nested_key), output_column, _clean_value)
         else:
-            transformed[target] = _clean_value(form_data.get(source_key))
+            steps[target] = (("data", source_key), target, _clean_value)
 
     # Add entity fields
-    entity = form.get("entity", {})
-    transformed["Serial number"] = form_serial_number
-    transformed["Oprettet"] = _parse_datetime(entity, "created")
-    transformed["Gennemført"] = _parse_datetime(entity, "completed")
+    steps["Serial number"] = (("entity", "serial"), "Serial number", _entity_value)
+    steps["Oprettet"] = (("entity", "created"), "Oprettet", _entity_datetime)
+    steps["Gennemført"] = (("entity", "completed"), "Gennemført", _entity_datetime)
+
+    return list(steps.values())
+
+
+def _get_transform_plan(mapping: dict) -> list[TransformStep]:
+    """
+    Returns the compiled plan for the mapping, compiling it on first use.
+    Plans are cached by the mapping's contents, so copies of a mapping share a plan and a changed mapping gets a new one.
+    """
+
+    return _compile_frozen_plan(_freeze_mapping(mapping))
+
+
+def _freeze_mapping(mapping: dict) -> tuple:
+    """Returns the mapping as nested tuples of (key, value) pairs in mapping order, usable as a cache key."""
+
+    return tuple(
+        (key, _freeze_mapping(value) if isinstance(value, dict) else value)
+        for key, value in mapping.items()
+    )
+
+
+@lru_cache(maxsize=config.TRANSFORM_PLAN_CACHE_SIZE)
+def _compile_frozen_plan(frozen_mapping: tuple) -> list[TransformStep]:
+    """Compiles the plan of a mapping frozen by _freeze_mapping."""
+
+    return compile_transform_plan(_thaw_mapping(frozen_mapping))
+
+
+def _thaw_mapping(frozen_mapping: tuple) -> dict:
+    return {
+        key: _thaw_mapping(value) if isinstance(value, tuple) else value
+        for key, value in frozen_mapping
+    }
+
+
+def _apply_transform_plan(plan: list[TransformStep], form: dict) -> dict:
+    """Runs a compiled plan against one form submission."""
+
+    transformed = {}
+
+    for source_path, output_column, cleaner in plan:
+        value = form
+
+        for key in source_path:
+            value = value.get(key) if isinstance(value, dict) else None
+
+        transformed[output_column] = cleaner(value)
 
     return transformed
 
@@ -47,23 +184,93 @@ def _clean_value(value):
         return ", ".join(str(v) for v in value)
 
     if isinstance(value, str):
-        value = value.replace("\r\n", ". ").replace("\n", ". ")
+        return _clean_string(value)
+
+    return value
 
-        try:
-            parsed = ast.literal_eval(value)
 
-            if isinstance(parsed, list):
-                return ", ".join(str(v) for v in parsed)
+@lru_cache(maxsize=config.CLEAN_VALUE_CACHE_SIZE)
+def _clean_string(value: str) -> str:
+    """Cleans a single string value. Memoized, as languages, schools and class levels repeat."""
+    value = value.replace("\r\n", ". ").replace("\n", ". ")
 
-        except Exception:
-            return value.strip("[]").replace("'", "").replace('"', "").strip()
+    # Without brackets, quotes or surrounding whitespace both branches below return the value
+    # unchanged, so the comparatively expensive literal parse can be skipped
+    if _LITERAL_CHARS.isdisjoint(value) and value == value.strip():
+        return value
+
+    try:
+        parsed = ast.literal_eval(value)
+
+        if isinstance(parsed, list):
+            return ", ".join(str(v) for v in parsed)
+
+    except Exception:
+        return value.strip("[]").replace("'", "").replace('"', "").strip()
 
     return value
 
 
+def _extract_column(values: list, keys: tuple[str, ...]) -> list:
+    """Follows the keys into each value, giving None where a level is missing."""
+    for key in keys:
+        values = [v.get(key) if isinstance(v, dict) else None for v in values]
+
+    return values
+
+
+def _clean_column(values: list) -> pd.Series:
+    """Vectorized _clean_value for a whole column. Each distinct string is only cleaned once."""
+    column = pd.Series(values, dtype=object)
+    is_list = column.map(lambda v: isinstance(v, list)).astype(bool)
+    is_str = column.map(lambda v: isinstance(v, str)).astype(bool)
+
+    if is_list.any():
+        column[is_list] = column[is_list].map(lambda v: ", ".join(str(x) for x in v))
+
+    if is_str.any():
+        codes, uniques = pd.factorize(column[is_str])
+        cleaned_uniques = np.array([_clean_string(u) for u in uniques], dtype=object)
+
+        column[is_str] = cleaned_uniques[codes]
+
+    return column
+
+
+def _entity_datetime_column(values: list) -> pd.Series:
+    """Vectorized _entity_datetime for a whole column."""
+    raw = pd.Series([_entity_value(v) for v in values], dtype=object)
+
+    is_iso = raw.map(type).eq(str)
+    is_iso[is_iso] = raw[is_iso].str.fullmatch(_ISO_DATETIME_PATTERN).astype(bool)
+
+    # The first 19 characters are the local wall-clock time, which is what fromisoformat keeps
+    parsed = pd.to_datetime(raw[is_iso].str.slice(0, 19), format="%Y-%m-%dT%H:%M:%S", errors="coerce")
+    formatted = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").reindex(raw.index).astype(object)
+
+    # Anything else that fromisoformat might accept is formatted one value at a time
+    remaining = raw.notna() & formatted.isna()
+    for index in remaining[remaining].index:
+        formatted[index] = _entity_datetime([{"value": raw[index]}])
+
+    return formatted.where(formatted.notna(), None)
+
+
 def _parse_datetime(entity, key):
+    return _entity_datetime(entity.get(key))
+
+
+def _entity_value(field):
+    try:
+        return field[0]["value"]
+
+    except Exception:
+        return None
+
+
+def _entity_datetime(field):
     try:
-        raw = entity[key][0]["value"]
+        raw = field[0]["value"]
 
         return datetime.fromisoformat(raw).strftime("%Y-%m-%d %H:%M:%S")
 
@@ -98,11 +305,212 @@ def get_workqueue_items(url, token, workqueue_id):
     return workqueue_items
 
 
-def get_forms_data(conn_string: str, form_type: str) -> list[dict]:
+def get_forms_data(
+    conn_string: str,
+    form_type: str,
+    since: date | datetime | None = None,
+    until: date | datetime | None = None,
+) -> list[dict]:
     """
     Retrieve form_data['data'] for all matching submissions for the given form type,
     excluding purged entries.
+
+    If given, since (inclusive) and until (exclusive) limit the submissions on
+    form_submitted_date in the database, so only that window is transferred and parsed.
+    """
+
+    extracted_data = list(iter_forms_data(conn_string, form_type, since=since, until=until))
+
+    if not extracted_data:
+        print("No submissions found for the given form type.")
+
+    return extracted_data
+
+
+def iter_forms_data(
+    conn_string: str,
+    form_type: str,
+    since: date | datetime | None = None,
+    until: date | datetime | None = None,
+    batch_size: int = config.DB_FETCH_BATCH_SIZE,
+    decode_workers: int = config.JSON_DECODE_WORKERS,
+) -> Iterator[dict]:
+    """
+    Yield the parsed form_data of matching submissions one at a time, excluding purged entries.
+
+    The cursor is read in batches of batch_size rows, so memory use does not grow with
+    the number of submissions. With decode_workers above 1 the batches are decoded in a
+    process pool, in the original order. See get_forms_data for since and until.
+    """
+
+    for _, _, form in iter_form_rows(conn_string, form_type, since, until, batch_size, decode_workers):
+        yield form
+
+
+def iter_form_rows(
+    conn_string: str,
+    form_type: str,
+    since: date | datetime | None = None,
+    until: date | datetime | None = None,
+    batch_size: int = config.DB_FETCH_BATCH_SIZE,
+    decode_workers: int = config.JSON_DECODE_WORKERS,
+) -> Iterator[tuple[Any, datetime, dict]]:
+    """
+    Like iter_forms_data, but yields (form_id, form_submitted_date, form_data) for each submission.
+    """
+
+    query, params = _build_forms_query(form_type, since, until)
+
+    engine = get_engine(conn_string)
+
+    with engine.connect() as conn:
+        try:
+            result = conn.exec_driver_sql(query, params)
+
+        except Exception as e:
+            print("Error when querying form data:", e)
+
+            raise
+
+        raw_batches = metrics.timed_batches("db_fetch", _fetch_raw_batches(result, batch_size), size=_raw_batch_bytes)
+
+        if decode_workers > 1:
+            decoded_batches = _decode_forms_parallel(raw_batches, decode_workers)
+
+        else:
+            decoded_batches = map(decode_forms, raw_batches)
+
+        decoded_batches = metrics.timed_batches("json_parse", decoded_batches)
+
+        for rows in decoded_batches:
+            yield from rows
+
+
+def get_purged_form_ids(conn_string: str, form_type: str, since: date | datetime | None = None) -> set[str]:
     """
+    Return the form_ids of submissions of the form type that have been purged,
+    limited to those submitted since the given time if one is given.
+    """
+
+    query, params = _build_forms_query(form_type, since, None, purged_only=True)
+
+    engine = get_engine(conn_string)
+
+    purged = set()
+
+    with engine.connect() as conn:
+        result = conn.exec_driver_sql(query, params)
+
+        for raw_rows in _fetch_raw_batches(result, config.DB_FETCH_BATCH_SIZE):
+            for form_id, raw, _ in raw_rows:
+                try:
+                    parsed = _json_loads(raw)
+
+                except json.JSONDecodeError:
+                    continue
+
+                # The LIKE in the query only narrows the rows down, the key decides
+                if "purged" in parsed:
+                    purged.add(str(form_id))
+
+    return purged
+
+
+def _fetch_raw_batches(result, batch_size: int) -> Iterator[list[tuple]]:
+    """Read (form_id, form_data, form_submitted_date) rows from a query result, batch_size rows at a time."""
+
+    while rows := result.fetchmany(batch_size):
+        yield [(row.form_id, row.form_data, row.form_submitted_date) for row in rows]
+
+
+def _raw_batch_bytes(raw_rows: list[tuple]) -> int:
+    # The length of form_data, in characters when the driver returns it as text
+    return sum(len(raw) for _, raw, _ in raw_rows if raw)
+
+
+def decode_forms(raw_rows: list[tuple]) -> list[tuple[Any, datetime, dict]]:
+    """
+    Parse the form_data JSON of a batch of (form_id, form_data, form_submitted_date) rows,
+    dropping invalid and purged entries. Uses orjson when it is installed.
+    """
+
+    rows = []
+
+    for form_id, raw, submitted_date in raw_rows:
+        try:
+            parsed = _json_loads(raw)
+
+        except json.JSONDecodeError:
+            print("Invalid JSON in form_data, skipping row.")
+
+            continue
+
+        if "purged" not in parsed:  # Skip purged entries
+            rows.append((form_id, submitted_date, parsed))
+
+    return rows
+
+
+def _decode_forms_parallel(raw_batches: Iterable[list[tuple]], workers: int) -> Iterator[list[tuple]]:
+    """
+    Decode batches with decode_forms in a process pool, yielding the results in input order.
+    At most two batches per worker are in flight, so a slow consumer does not pile up results.
+    """
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+
+        for raw_rows in raw_batches:
+            pending.append(executor.submit(decode_forms, raw_rows))
+
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_engine(conn_string: str) -> Engine:
+    """
+    Return the pooled SQLAlchemy engine for the given ODBC connection string.
+    The engine is created on first use and reused by later calls in the same run.
+    """
+
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(conn_string)
+
+        if engine is None:
+            encoded_conn_str = urllib.parse.quote_plus(conn_string)
+            engine = create_engine(
+                f"mssql+pyodbc:///?odbc_connect={encoded_conn_str}",
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_MAX_OVERFLOW,
+                pool_recycle=config.DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+            _ENGINES[conn_string] = engine
+
+    return engine
+
+
+@atexit.register
+def dispose_engines() -> None:
+    """Close all pooled database connections. Runs automatically at process exit."""
+
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+
+        _ENGINES.clear()
+
+
+def _build_forms_query(
+    form_type: str,
+    since: date | datetime | None,
+    until: date | datetime | None,
+    purged_only: bool = False,
+) -> tuple[str, tuple]:
+    """Build the submissions query and its parameters for the given form type and window, optionally of purged submissions only."""
 
     query = """
         SELECT
@@ -115,36 +523,21 @@ def get_forms_data(conn_string: str, form_type: str) -> list[dict]:
             form_type = ?
             AND form_data IS NOT NULL
             AND form_submitted_date IS NOT NULL
-        ORDER BY form_submitted_date DESC
     """
 
-    # Create SQLAlchemy engine
-    encoded_conn_str = urllib.parse.quote_plus(conn_string)
-    engine = create_engine(f"mssql+pyodbc:///?odbc_connect={encoded_conn_str}")
+    params: list = [form_type]
 
-    try:
-        df = pd.read_sql(sql=query, con=engine, params=(form_type,))
-
-    except Exception as e:
-        print("Error during pd.read_sql:", e)
-
-        raise
+    if since is not None:
+        query += "        AND form_submitted_date >= ?\n"
+        params.append(since)
 
-    if df.empty:
-        print("No submissions found for the given form type.")
-
-        return []
+    if until is not None:
+        query += "        AND form_submitted_date < ?\n"
+        params.append(until)
 
-    extracted_data = []
+    if purged_only:
+        query += "        AND form_data LIKE '%\"purged\"%'\n"
 
-    for _, row in df.iterrows():
-        try:
-            parsed = json.loads(row["form_data"])
+    query += "        ORDER BY form_submitted_date DESC\n"
 
-            if "purged" not in parsed:  # Skip purged entries
-                extracted_data.append(parsed)
-
-        except json.JSONDecodeError:
-            print("Invalid JSON in form_data, skipping row.")
-
-    return extracted_data
+    return query, tuple(params)
@@ -0,0 +1,314 @@
+"""Opt-in memory profiling at the stage boundaries of helpers.metrics"""
+
+import ctypes
+import datetime
+import linecache
+import os
+import sys
+import threading
+import tokenize
+import tracemalloc
+
+from helpers import config, metrics
+
+try:
+    import psutil
+
+except ImportError:  # in environments without it, RSS is read from /proc, getrusage or GetProcessMemoryInfo
+    psutil = None
+
+try:
+    import resource
+
+except ImportError:  # not available on Windows
+    resource = None
+
+# The profiler's own allocations, those of reading source lines for the report and those of imports are left out
+_IGNORED_FILES = {
+    __file__,
+    metrics.__file__,
+    tracemalloc.__file__,
+    linecache.__file__,
+    tokenize.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+}
+
+
+class _OpenStage:
+    """Memory state of a stage between its first entry and its record"""
+
+    def __init__(self, snapshot: tracemalloc.Snapshot | None, rss: int | None):
+        self.snapshot = snapshot
+        self.traced_peak = 0
+        self.rss_peak = rss
+
+
+class MemoryProfiler:
+    """
+    Follows memory use from stage to stage with tracemalloc and samples of the resident set size.
+
+    The traced peak and the sampled RSS peak between two boundaries are counted for every stage
+    open at the time, so nested stages share their peaks. For the first snapshot_limit occurrences
+    of each stage, a snapshot is also taken when the stage is first entered and when it is
+    recorded, and the sites that grew the most in between are kept. Snapshots take a while on a
+    large heap, which is why later occurrences only get their peaks.
+
+    Stages on other threads allocate into the same snapshots, and process pool workers are not traced.
+    """
+
+    def __init__(
+        self,
+        top: int = config.MEMORY_PROFILE_TOP,
+        frames: int = config.MEMORY_PROFILE_FRAMES,
+        snapshot_limit: int = config.MEMORY_PROFILE_SNAPSHOT_LIMIT,
+        sample_interval: float = config.MEMORY_RSS_SAMPLE_INTERVAL,
+    ):
+        self.top = top
+        self.frames = frames
+        self.snapshot_limit = snapshot_limit
+        self.sample_interval = sample_interval
+
+        self._open: dict[int, _OpenStage] = {}
+        self._stages: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def start(self):
+        """Start tracing allocations and sampling the RSS, forgetting any earlier run."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+        self._stages.clear()
+        self._stop.clear()
+
+        if _current_rss() is not None and self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """Stop sampling and tracing."""
+        self._stop.set()
+
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+        tracemalloc.stop()
+
+    def begin(self, stage):
+        """Start following a stage, with a snapshot while under the snapshot limit."""
+        self._boundary()
+
+        with self._lock:
+            summary = self._stages.setdefault(stage.name, {"occurrences": 0, "snapshots": 0, "traced_peak_bytes": 0, "rss_peak_bytes": None, "profiled": None})
+            take_snapshot = summary["snapshots"] < self.snapshot_limit
+
+            if take_snapshot:
+                summary["snapshots"] += 1
+
+        snapshot = _snapshot() if take_snapshot else None
+
+        with self._lock:
+            self._open[id(stage)] = _OpenStage(snapshot, _current_rss())
+
+    def end(self, stage) -> dict:
+        """Stop following a stage and return its memory fields for the stage record."""
+        self._boundary()
+
+        with self._lock:
+            opened = self._open.pop(id(stage), None)
+
+        if opened is None:
+            return {}
+
+        rss = _current_rss()
+
+        fields = {
+            "traced_peak_bytes": opened.traced_peak,
+            "rss_bytes": rss,
+            "rss_peak_bytes": max((value for value in (opened.rss_peak, rss) if value is not None), default=None),
+            "process_peak_rss_bytes": _process_peak_rss(),
+        }
+
+        sites = None
+
+        if opened.snapshot is not None:
+            growth = _growth(_snapshot(), opened.snapshot)
+            fields["traced_growth_bytes"] = sum(stat.size_diff for stat in growth)
+
+            sites = [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "code": linecache.getline(stat.traceback[0].filename, stat.traceback[0].lineno).strip(),
+                    "growth_bytes": stat.size_diff,
+                    "blocks": stat.count_diff,
+                }
+                for stat in growth[:self.top]
+                if stat.size_diff > 0
+            ]
+
+        with self._lock:
+            summary = self._stages[stage.name]
+            summary["occurrences"] += 1
+            summary["traced_peak_bytes"] = max(summary["traced_peak_bytes"], fields["traced_peak_bytes"])
+
+            if fields["rss_peak_bytes"] is not None:
+                summary["rss_peak_bytes"] = max(summary["rss_peak_bytes"] or 0, fields["rss_peak_bytes"])
+
+            # Of the occurrences with a snapshot, the report shows the one with the highest traced peak
+            profiled = summary["profiled"]
+
+            if sites is not None and (profiled is None or fields["traced_peak_bytes"] > profiled["traced_peak_bytes"]):
+                summary["profiled"] = {**fields, "sites": sites}
+
+        return fields
+
+    def write_report(self, process_name: str, run_id: str) -> str:
+        """Write the report of the run to MEMORY_PROFILE_FOLDER and return its path."""
+        os.makedirs(config.MEMORY_PROFILE_FOLDER, exist_ok=True)
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(config.MEMORY_PROFILE_FOLDER, f"{process_name}-{timestamp}-{run_id}.txt")
+
+        with self._lock:
+            stages = {name: dict(summary) for name, summary in self._stages.items()}
+
+        with open(path, "w", encoding="utf-8") as report:
+            report.write(f"Memory profile of the {process_name} run {run_id}, {timestamp}, Python {sys.version.split()[0]}\n")
+            report.write(f"Process peak RSS: {_megabytes(_process_peak_rss())}\n")
+
+            if _current_rss() is None:
+                report.write("Warning: the RSS could not be read on this platform, only traced memory is reported\n")
+
+            for name, summary in stages.items():
+                report.write(
+                    f"\n== {name}: {summary['occurrences']} occurrences, "
+                    f"traced peak {_megabytes(summary['traced_peak_bytes'])}, RSS peak {_megabytes(summary['rss_peak_bytes'])}\n"
+                )
+
+                profiled = summary["profiled"]
+
+                if profiled is None:
+                    continue
+
+                report.write(
+                    f"Growth of the snapshotted occurrence with the highest traced peak ({_megabytes(profiled['traced_peak_bytes'])}): "
+                    f"{_megabytes(profiled['traced_growth_bytes'])} in total\n"
+                )
+
+                report.writelines(
+                    f"  {_megabytes(site['growth_bytes']):>10} in {site['blocks']:>8} blocks  {site['site']}\n"
+                    f"      {site['code']}\n"
+                    for site in profiled["sites"]
+                )
+
+        return path
+
+    def _boundary(self):
+        # Count the traced peak since the last boundary for every open stage, then start a new interval
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+
+        with self._lock:
+            for opened in self._open.values():
+                opened.traced_peak = max(opened.traced_peak, peak)
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = _current_rss()
+
+            # A failed reading is skipped, the next sample may succeed
+            if rss is None:
+                continue
+
+            with self._lock:
+                for opened in self._open.values():
+                    opened.rss_peak = max(opened.rss_peak or 0, rss)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot()
+
+
+def _growth(snapshot: tracemalloc.Snapshot, earlier: tracemalloc.Snapshot) -> list[tracemalloc.StatisticDiff]:
+    # Filtering the grouped statistics is much faster than Snapshot.filter_traces on every trace
+    return [
+        stat
+        for stat in snapshot.compare_to(earlier, "lineno")
+        if stat.traceback[0].filename not in _IGNORED_FILES
+    ]
+
+
+def _current_rss() -> int | None:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    if sys.platform == "win32":
+        counters = _windows_memory_counters()
+
+        return counters.WorkingSetSize if counters is not None else None
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _process_peak_rss() -> int | None:
+    if sys.platform == "win32":
+        if psutil is not None:
+            return psutil.Process().memory_info().peak_wset
+
+        counters = _windows_memory_counters()
+
+        return counters.PeakWorkingSetSize if counters is not None else None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    return None
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def _windows_memory_counters() -> _ProcessMemoryCounters | None:
+    # PROCESS_MEMORY_COUNTERS of the current process, without psutil
+    counters = _ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+
+    try:
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+        kernel32.K32GetProcessMemoryInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(_ProcessMemoryCounters), ctypes.c_ulong]
+
+        if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+
+    except (AttributeError, OSError):
+        return None
+
+    return counters
+
+
+def _megabytes(value: int | None) -> str:
+    return "n/a" if value is None else f"{value / 1e6:.1f} MB"
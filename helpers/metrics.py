@@ -0,0 +1,210 @@
+"""Stage timing spans, written as structured JSON records with a summary per run"""
+
+import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_LOCAL = threading.local()
+
+_RUN = {"id": None, "name": None, "started": None}
+_PROFILER = None  # a helpers.memory_profile.MemoryProfiler while memory profiling is on
+_TOTALS: dict[str, dict] = {}
+_TOTALS_LOCK = threading.Lock()
+
+
+class Stage:
+    """
+    A timed stage, which can be entered several times before it is recorded, e.g. once per batch.
+
+    Time spent in stages entered inside this one, on the same thread, is not counted as this
+    stage's own, so a date filter pulling rows from a database fetch only gets its own time.
+    """
+
+    def __init__(self, name: str, **fields):
+        self.name = name
+        self.seconds = 0.0
+        self.fields = fields
+        self._start = 0.0
+        self._nested = 0.0
+        self._profiled = False
+
+    def add(self, **counts):
+        """Add to counts such as rows or bytes."""
+        for key, value in counts.items():
+            self.fields[key] = self.fields.get(key, 0) + value
+
+    def __enter__(self) -> "Stage":
+        stack = _stack()
+
+        # Memory is followed from the first entry to the record, not per batch
+        if _PROFILER is not None and not self._profiled:
+            _profile(stack, _PROFILER.begin, self)
+            self._profiled = True
+
+        stack.append(self)
+
+        self._nested = 0.0
+        self._start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        stack = _stack()
+        stack.pop()
+
+        self.seconds += elapsed - self._nested
+
+        if stack:
+            stack[-1]._nested += elapsed
+
+        return False
+
+    def record(self):
+        """Write the stage's record and add it to the run summary."""
+        if _PROFILER is not None and self._profiled:
+            self.fields.update(_profile(_stack(), _PROFILER.end, self))
+
+        record_stage(self.name, self.seconds, **self.fields)
+
+
+@contextmanager
+def stage(name: str, **fields) -> Iterator[Stage]:
+    """Time the block as one stage and record it, also when the block raises."""
+    span = Stage(name, **fields)
+
+    try:
+        with span:
+            yield span
+
+    finally:
+        span.record()
+
+
+def timed_batches(name: str, batches: Iterable[list], size=None) -> Iterator[list]:
+    """
+    Yield the batches, timing only the work of producing them as one stage, with their rows,
+    and their bytes if size is given. The stage is recorded when the batches run out or are abandoned.
+    """
+    span = Stage(name, rows=0)
+    iterator = iter(batches)
+
+    try:
+        while True:
+            with span:
+                batch = next(iterator, None)
+
+            if batch is None:
+                return
+
+            span.add(rows=len(batch))
+
+            if size:
+                span.add(bytes=size(batch))
+
+            yield batch
+
+    finally:
+        span.record()
+
+
+def record_stage(name: str, seconds: float, **fields):
+    """Write one stage record and add it to the run summary."""
+    with _TOTALS_LOCK:
+        totals = _TOTALS.setdefault(name, {"count": 0, "seconds": 0.0})
+        totals["count"] += 1
+        totals["seconds"] += seconds
+
+        for key, value in fields.items():
+            # Memory readings are levels, not amounts, so the summary keeps their maximum
+            if key.endswith("_bytes") and value is not None:
+                totals[key] = max(totals.get(key, 0), value)
+
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+
+    _emit({"event": "stage", "stage": name, "seconds": round(seconds, 6), **fields})
+
+
+def enable_memory_profiling(profiler):
+    """Follow memory use at every stage boundary with the profiler, from the next run on."""
+    global _PROFILER
+
+    _PROFILER = profiler
+
+
+def start_run(name: str):
+    """Start a new run, clearing the summary of any earlier one."""
+    with _TOTALS_LOCK:
+        _TOTALS.clear()
+        _RUN.update(id=uuid.uuid4().hex[:12], name=name, started=time.perf_counter())
+
+    if _PROFILER is not None:
+        _PROFILER.start()
+
+
+def log_run_summary():
+    """
+    Write the run's wall time and the totals of each stage, in the order they were first recorded.
+    When memory profiling is on, its report is written too and named in the summary.
+    """
+    with _TOTALS_LOCK:
+        stages = {name: {**totals, "seconds": round(totals["seconds"], 6)} for name, totals in _TOTALS.items()}
+
+    seconds = time.perf_counter() - _RUN["started"] if _RUN["started"] is not None else None
+
+    summary = {
+        "event": "run_summary",
+        "seconds": round(seconds, 6) if seconds is not None else None,
+        "stages": stages,
+    }
+
+    if _PROFILER is not None:
+        summary["memory_report"] = _PROFILER.write_report(_RUN["name"], _RUN["id"])
+        _PROFILER.stop()
+
+    _emit(summary)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats metrics records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "thread": record.threadName,
+        }
+
+        document.update(getattr(record, "metrics", None) or {"message": record.getMessage()})
+
+        return json.dumps(document, ensure_ascii=False, default=str)
+
+
+def _emit(document: dict):
+    logger.info(document.get("event"), extra={"metrics": {"run": _RUN["id"], "process": _RUN["name"], **document}})
+
+
+def _stack() -> list[Stage]:
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+
+    return _LOCAL.stack
+
+
+def _profile(stack: list[Stage], step, stage: Stage):
+    # The profiler's own time is left out of the stage it runs inside
+    start = time.perf_counter()
+
+    try:
+        return step(stage)
+
+    finally:
+        if stack:
+            stack[-1]._nested += time.perf_counter() - start
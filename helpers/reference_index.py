@@ -0,0 +1,137 @@
+"""Local SQLite index of the references already in a workqueue, used to skip duplicates when populating it"""
+
+import logging
+import os
+import sqlite3
+
+from automation_server_client import Workqueue
+
+from helpers import ats_functions, config
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS queue_references (
+        workqueue_id TEXT NOT NULL,
+        reference TEXT NOT NULL,
+        PRIMARY KEY (workqueue_id, reference)
+    );
+
+    CREATE TABLE IF NOT EXISTS sync_state (
+        workqueue_id TEXT PRIMARY KEY,
+        items_seen INTEGER NOT NULL,
+        last_item TEXT
+    );
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceIndex:
+    """
+    The references of one workqueue, kept in a local SQLite file between runs.
+
+    The index remembers how many items it has seen and which item was the last one, and a sync
+    only pulls the pages from that item on. That holds while the Automation Server lists items
+    oldest first and no item before it has been removed, so the sync checks that the last item is
+    still at the same position, and rebuilds the index from scratch with a full sync when it is not.
+    """
+
+    def __init__(self, path: str, workqueue: Workqueue):
+        self.path = path
+        self.workqueue_id = str(workqueue.id)
+        self.workqueue = workqueue
+        self.conn: sqlite3.Connection | None = None
+
+    def __enter__(self) -> "ReferenceIndex":
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path)
+
+        # Indexes from before last_item was kept are dropped, the next sync is then a full one
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(sync_state)")]
+        if columns and "last_item" not in columns:
+            self.conn.execute("DROP TABLE sync_state")
+
+        self.conn.executescript(SCHEMA)
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+
+        else:
+            self.conn.rollback()
+
+        self.conn.close()
+        self.conn = None
+
+    def __contains__(self, reference: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM queue_references WHERE workqueue_id = ? AND reference = ?",
+            (self.workqueue_id, str(reference)),
+        ).fetchone()
+
+        return row is not None
+
+    def sync(self, full: bool = False) -> int:
+        """
+        Pull the workqueue pages added since the last sync, or all pages if full is set.
+        Falls back to a full sync when the workqueue has changed in a way the index cannot follow.
+        Returns the number of items read from the Automation Server.
+        """
+        stored_items_seen, stored_last_item = (0, None) if full else self._get_sync_state()
+
+        # The page holding the last item seen is read again, to check it has not moved
+        first_page = max(stored_items_seen - 1, 0) // config.ATS_PAGE_SIZE + 1
+        items_seen = (first_page - 1) * config.ATS_PAGE_SIZE
+        last_item_offset = stored_items_seen - 1 - items_seen
+        items_read = 0
+        last_item = None
+
+        if full:
+            self.conn.execute("DELETE FROM queue_references WHERE workqueue_id = ?", (self.workqueue_id,))
+
+        for page in ats_functions.iter_workqueue_pages(self.workqueue, first_page=first_page):
+            if items_read == 0 and stored_items_seen and not _item_at(page, last_item_offset, stored_last_item):
+                logger.warning("The last indexed workqueue item has moved, rebuilding the reference index.")
+
+                return self.sync(full=True)
+
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO queue_references VALUES (?, ?)",
+                [(self.workqueue_id, str(row["reference"])) for row in page if row.get("reference")],
+            )
+
+            items_read += len(page)
+            last_item = _item_key(page[-1])
+
+        if stored_items_seen and items_read == 0:
+            logger.warning("The workqueue has fewer items than indexed, rebuilding the reference index.")
+
+            return self.sync(full=True)
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+            (self.workqueue_id, items_seen + items_read, last_item or stored_last_item),
+        )
+
+        return items_read
+
+    def _get_sync_state(self) -> tuple[int, str | None]:
+        row = self.conn.execute(
+            "SELECT items_seen, last_item FROM sync_state WHERE workqueue_id = ?",
+            (self.workqueue_id,),
+        ).fetchone()
+
+        return (row[0], row[1]) if row else (0, None)
+
+
+def _item_key(row: dict) -> str:
+    """The item id, or the reference for listings without ids."""
+    return str(row.get("id") if row.get("id") is not None else row.get("reference"))
+
+
+def _item_at(page: list[dict], offset: int, item_key: str | None) -> bool:
+    return item_key is not None and offset < len(page) and _item_key(page[offset]) == item_key
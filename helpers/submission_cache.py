@@ -0,0 +1,176 @@
+"""Local SQLite cache of transformed OS2 submissions, so queue runs only fetch new submissions"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections.abc import Iterable
+from datetime import date, datetime
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS submissions (
+        form_type TEXT NOT NULL,
+        form_id TEXT NOT NULL,
+        form_submitted_date TEXT NOT NULL,
+        completed_date TEXT,
+        row_json TEXT NOT NULL,
+        PRIMARY KEY (form_type, form_id)
+    );
+
+    CREATE INDEX IF NOT EXISTS ix_submissions_completed
+        ON submissions (form_type, completed_date);
+
+    CREATE TABLE IF NOT EXISTS sync_state (
+        form_type TEXT PRIMARY KEY,
+        mapping_hash TEXT NOT NULL,
+        covered_since TEXT NOT NULL,
+        watermark TEXT
+    );
+"""
+
+
+class SubmissionCache:
+    """
+    Transformed submission rows keyed by form_id, per form type.
+
+    For each form type the cache records the window it holds: every submission with a
+    form_submitted_date from covered_since onwards, up to the watermark, the latest
+    form_submitted_date seen. The cached rows for a form type are dropped when its
+    formular mapping changes. Rows hold personal data unencrypted, so they are only kept for the
+    window a run needs, see prune and delete, and the cache is off unless SUBMISSION_CACHE_PATH
+    is set. The file and its folder are created if missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+
+    def __enter__(self) -> "SubmissionCache":
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+
+        else:
+            self.conn.rollback()
+
+        self.conn.close()
+        self.conn = None
+
+    def get_sync_state(self, form_type: str, mapping: dict) -> tuple[datetime | None, datetime | None]:
+        """
+        Return (covered_since, watermark) for the form type, or (None, None) if nothing usable is cached.
+        """
+        row = self.conn.execute(
+            "SELECT mapping_hash, covered_since, watermark FROM sync_state WHERE form_type = ?",
+            (form_type,),
+        ).fetchone()
+
+        if row is None:
+            return None, None
+
+        mapping_hash, covered_since, watermark = row
+
+        if mapping_hash != _mapping_hash(mapping):
+            self.clear(form_type)
+
+            return None, None
+
+        return datetime.fromisoformat(covered_since), datetime.fromisoformat(watermark) if watermark else None
+
+    def store(
+        self,
+        form_type: str,
+        mapping: dict,
+        rows: Iterable[tuple[str, datetime, dict]],
+    ) -> datetime | None:
+        """
+        Insert or replace (form_id, form_submitted_date, transformed row) entries.
+        Returns the latest form_submitted_date among them, or None if there were none.
+        """
+        latest = None
+        entries = []
+
+        for form_id, submitted_date, transformed_row in rows:
+            completed = transformed_row.get("Gennemført")
+
+            entries.append((
+                form_type,
+                str(form_id),
+                submitted_date.isoformat(),
+                completed[:10] if completed else None,
+                json.dumps(transformed_row, ensure_ascii=False),
+            ))
+
+            if latest is None or submitted_date > latest:
+                latest = submitted_date
+
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?)",
+            entries,
+        )
+
+        return latest
+
+    def set_sync_state(self, form_type: str, mapping: dict, covered_since: datetime, watermark: datetime | None):
+        """Record the window now held for the form type."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+            (
+                form_type,
+                _mapping_hash(mapping),
+                covered_since.isoformat(),
+                watermark.isoformat() if watermark else None,
+            ),
+        )
+
+    def get_completed_between(self, form_type: str, start: date, end: date) -> list[dict]:
+        """Return cached rows completed between start and end, both inclusive, newest submission first."""
+        rows = self.conn.execute(
+            """
+                SELECT row_json
+                FROM submissions
+                WHERE form_type = ? AND completed_date BETWEEN ? AND ?
+                ORDER BY form_submitted_date DESC
+            """,
+            (form_type, start.isoformat(), end.isoformat()),
+        )
+
+        return [json.loads(row_json) for (row_json,) in rows]
+
+    def prune(self, form_type: str, before: datetime):
+        """Drop cached rows submitted before the given time and move covered_since up to it."""
+        self.conn.execute(
+            "DELETE FROM submissions WHERE form_type = ? AND form_submitted_date < ?",
+            (form_type, before.isoformat()),
+        )
+        self.conn.execute(
+            "UPDATE sync_state SET covered_since = ? WHERE form_type = ? AND covered_since < ?",
+            (before.isoformat(), form_type, before.isoformat()),
+        )
+
+    def delete(self, form_type: str, form_ids: Iterable[str]) -> int:
+        """Drop the cached rows of the given form_ids, e.g. submissions purged since they were cached. Returns how many were dropped."""
+        cursor = self.conn.executemany(
+            "DELETE FROM submissions WHERE form_type = ? AND form_id = ?",
+            ((form_type, str(form_id)) for form_id in form_ids),
+        )
+
+        return cursor.rowcount
+
+    def clear(self, form_type: str):
+        """Drop all cached rows and sync state for the form type, forcing a full refetch."""
+        self.conn.execute("DELETE FROM submissions WHERE form_type = ?", (form_type,))
+        self.conn.execute("DELETE FROM sync_state WHERE form_type = ?", (form_type,))
+
+
+def _mapping_hash(mapping: dict) -> str:
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True).encode("utf-8")).hexdigest()
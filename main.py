@@ -5,15 +5,20 @@ This is the main entry point for the process
 import asyncio
 import logging
 import sys
+import threading
+from collections.abc import Container
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
-from automation_server_client import AutomationServer, Workqueue
+from automation_server_client import AutomationServer, WorkItem, Workqueue
 
 from mbu_rpa_core.exceptions import BusinessError, ProcessError
 from mbu_rpa_core.process_states import CompletedState
 
-from helpers import ats_functions, config
+from helpers import ats_functions, config, metrics
+from helpers.memory_profile import MemoryProfiler
+from helpers.reference_index import ReferenceIndex
 
 from processes.application_handler import close, reset, startup
 from processes.error_handling import ErrorContext, handle_error
@@ -51,11 +56,28 @@ async def populate_queue(workqueue: Workqueue):
 
     items_to_queue = retrieve_items_for_queue()
 
-    queue_references = {str(r) for r in ats_functions.get_workqueue_items(workqueue)}
+    if config.REFERENCE_INDEX_PATH:
+        with ReferenceIndex(config.REFERENCE_INDEX_PATH, workqueue) as queue_references:
+            synced = queue_references.sync(full="--full-resync" in sys.argv)
+            logger.info(f"Workqueue reference index synced, {synced} items read.")
+
+            new_items = _filter_new_items(items_to_queue, queue_references)
+
+    else:
+        queue_references = {str(r) for r in ats_functions.get_workqueue_items(workqueue)}
+
+        new_items = _filter_new_items(items_to_queue, queue_references)
+
+    await concurrent_add(workqueue, new_items)
+    logger.info("Finished populating workqueue.")
+
+
+def _filter_new_items(items: list[dict], queue_references: Container[str]) -> list[dict]:
+    """Drop the items whose reference is already in the workqueue."""
 
     new_items: list[dict] = []
 
-    for item in items_to_queue:
+    for item in items:
         reference = str(item.get("reference") or "")
 
         if reference and reference in queue_references:
@@ -63,8 +85,7 @@ async def populate_queue(workqueue: Workqueue):
 
         new_items.append(item)
 
-    await concurrent_add(workqueue, new_items)
-    logger.info("Finished populating workqueue.")
+    return new_items
 
 
 async def process_workqueue(workqueue: Workqueue):
@@ -77,63 +98,114 @@ async def process_workqueue(workqueue: Workqueue):
     error_count = 0
 
     while error_count < config.MAX_RETRY:
-        for item in workqueue:
-            try:
-                with item:
-                    data, reference = ats_functions.get_item_info(item)
+        if config.PROCESS_WORKERS > 1:
+            error_count += await _process_items_concurrently(workqueue, config.PROCESS_WORKERS)
+
+        else:
+            for item in workqueue:
+                if not _process_work_item(workqueue, item):
+                    error_count += 1
+
+                    reset(logger=logger)
+
+        break
+
+    logger.info("Finished processing workqueue.")
+    close(logger=logger)
+
+
+async def _process_items_concurrently(workqueue: Workqueue, workers: int) -> int:
+    """
+    Claim and process work items on a pool of worker threads until the workqueue is empty.
+    Returns the number of items that failed with a ProcessError.
+    """
+
+    items = iter(workqueue)
+    claim_lock = threading.Lock()
+    reset_lock = threading.Lock()
+
+    def worker() -> int:
+        failed = 0
+
+        while True:
+            # One claim at a time, the Workqueue iterator is not made for concurrent use
+            with claim_lock:
+                item = next(items, None)
+
+            if item is None:
+                return failed
 
-                    try:
-                        logger.info(f"Processing item with reference: {reference}")
-                        completed_message = process_item(item_data=data)
+            if not _process_work_item(workqueue, item):
+                failed += 1
 
-                        logger.info(f"Finished processing item with reference: {reference}")
+                with reset_lock:
+                    reset(logger=logger)
 
-                        completed_state = CompletedState.completed(completed_message)
-                        item.complete(str(completed_state))
+    logger.info(f"Processing with {workers} workers")
 
-                        continue
+    loop = asyncio.get_running_loop()
 
-                    except BusinessError as e:
-                        context = ErrorContext(
-                            item=item,
-                            action=item.pending_user,
-                            send_mail=False,
-                            process_name=workqueue.name,
-                        )
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workqueue-worker") as executor:
+        results = await asyncio.gather(*(loop.run_in_executor(executor, worker) for _ in range(workers)))
 
-                        handle_error(
-                            error=e,
-                            log=logger.info,
-                            context=context,
-                        )
+    return sum(results)
 
-                    except Exception as e:
-                        pe = ProcessError(str(e))
 
-                        raise pe from e
+def _process_work_item(workqueue: Workqueue, item: WorkItem) -> bool:
+    """
+    Process one claimed work item and complete it, or leave it pending the user on a BusinessError,
+    or fail it on any other error. Returns False if the item failed.
+    """
 
-            except ProcessError as e:
+    try:
+        with item:
+            data, reference = ats_functions.get_item_info(item)
+
+            try:
+                logger.info(f"Processing item with reference: {reference}")
+                completed_message = process_item(item_data=data)
+
+                logger.info(f"Finished processing item with reference: {reference}")
+
+                completed_state = CompletedState.completed(completed_message)
+                item.complete(str(completed_state))
+
+            except BusinessError as e:
                 context = ErrorContext(
                     item=item,
-                    action=item.fail,
-                    send_mail=True,
+                    action=item.pending_user,
+                    send_mail=False,
                     process_name=workqueue.name,
                 )
 
                 handle_error(
                     error=e,
-                    log=logger.error,
+                    log=logger.info,
                     context=context,
                 )
 
-                error_count += 1
+            except Exception as e:
+                pe = ProcessError(str(e))
 
-                reset(logger=logger)
+                raise pe from e
 
-        break
+    except ProcessError as e:
+        context = ErrorContext(
+            item=item,
+            action=item.fail,
+            send_mail=True,
+            process_name=workqueue.name,
+        )
 
-    logger.info("Finished processing workqueue.")
-    close(logger=logger)
+        handle_error(
+            error=e,
+            log=logger.error,
+            context=context,
+        )
+
+        return False
+
+    return True
 
 
 async def finalize(workqueue: Workqueue):
@@ -159,9 +231,24 @@ async def finalize(workqueue: Workqueue):
         raise pe from e
 
 
+async def _run_measured(name: str, run):
+    """Await the run, then log the summary of its stage metrics, also when it fails."""
+
+    metrics.start_run(name)
+
+    try:
+        await run
+
+    finally:
+        metrics.log_run_summary()
+
+
 if __name__ == "__main__":
     ats_functions.init_logger()
 
+    if "--profile-memory" in sys.argv:
+        metrics.enable_memory_profiling(MemoryProfiler())
+
     ats = AutomationServer.from_environment()
 
     prod_workqueue = ats.workqueue()
@@ -169,14 +256,14 @@ if __name__ == "__main__":
 
     # Queue management
     if "--queue" in sys.argv:
-        asyncio.run(populate_queue(prod_workqueue))
+        asyncio.run(_run_measured("queue", populate_queue(prod_workqueue)))
 
     if "--process" in sys.argv:
         # Process workqueue
-        asyncio.run(process_workqueue(prod_workqueue))
+        asyncio.run(_run_measured("process", process_workqueue(prod_workqueue)))
 
     if "--finalize" in sys.argv:
         # Finalize process
-        asyncio.run(finalize(prod_workqueue))
+        asyncio.run(_run_measured("finalize", finalize(prod_workqueue)))
 
     sys.exit(0)
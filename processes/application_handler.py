@@ -2,6 +2,8 @@
 
 import logging
 
+from processes.process_item import clear_folder_listings, clear_sharepoint_clients
+
 
 def startup(logger: logging.Logger):
     """Function for starting applications"""
@@ -24,6 +26,9 @@ def close(logger: logging.Logger):
         soft_close(logger)
     except Exception:
         hard_close(logger)
+    finally:
+        clear_sharepoint_clients()
+        clear_folder_listings()
 
 
 def reset(logger: logging.Logger):
@@ -1,11 +1,19 @@
 """Module for handling errors"""
 
+import atexit
 import base64
+import datetime
+import html
 import json
+import logging
+import queue
 import smtplib
+import threading
+import time
 from collections.abc import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from email.message import EmailMessage
+from functools import lru_cache
 from io import BytesIO
 
 from automation_server_client import WorkItem
@@ -13,6 +21,10 @@ from mbu_dev_shared_components.database.connection import RPAConnection
 from mbu_rpa_core.exceptions import BusinessError, ProcessError
 from PIL import ImageGrab
 
+from helpers import config
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class ErrorContext:
@@ -65,53 +77,248 @@ def send_error_email(
     process_name: str | None = None,
 ) -> None:
     """
-    Send email to defined recipient with error information
+    Queue an email to the defined recipient with error information, sent by a background worker.
+    Identical errors arriving close together are sent as one mail with their count, see ErrorMailer.
     Args:
         error (ProcessError | BusinessError): The error to include in the email.
         add_screenshot (bool): Whether to include a screenshot in the email.
         process_name (str | None): Name of the process where the error occurred.
     Returns:
         None
-    Raises:
-        Exception: If sending the email fails.
     """
+    get_error_mailer().submit(error, add_screenshot=add_screenshot, process_name=process_name)
+
+
+@dataclass(frozen=True)
+class EmailSettings:
+    """Where error emails are sent from and to"""
+
+    recipient: str
+    sender: str
+    smtp_server: str
+    smtp_port: int
+    starttls: bool = True
+
+
+@lru_cache(maxsize=1)
+def get_email_settings() -> EmailSettings:
+    """Read the email constants from the RPA database once, and reuse them for the life of the process."""
     rpa_conn = RPAConnection(db_env="PROD", commit=False)
     with rpa_conn:
-        error_email = rpa_conn.get_constant("Error Email")["value"]
-        error_sender = rpa_conn.get_constant("Email Friend")[
-            "value"
-        ]  # Find in database...
-        smtp_server = rpa_conn.get_constant("smtp_server")["value"]
-        smtp_port = rpa_conn.get_constant("smtp_port")["value"]
-
-    # Create message
+        return EmailSettings(
+            recipient=rpa_conn.get_constant("Error Email")["value"],
+            sender=rpa_conn.get_constant("Email Friend")["value"],
+            smtp_server=rpa_conn.get_constant("smtp_server")["value"],
+            smtp_port=int(rpa_conn.get_constant("smtp_port")["value"]),
+        )
+
+
+@dataclass
+class _ReportedError:
+    """An error waiting to be mailed, with how often it occurred"""
+
+    process_name: str | None
+    error_dict: dict
+    screenshot: str | None
+    count: int = 1
+    first_seen: datetime.datetime = field(default_factory=datetime.datetime.now)
+    last_seen: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+
+class ErrorMailer:
+    """
+    Sends error emails from a queue on a worker thread, so the processing path never waits for SMTP.
+
+    The worker collects errors for batch_seconds after the first one, and no sooner than
+    min_interval seconds after its previous mail, then sends everything collected as one mail.
+    Errors with the same process, type and message are listed once, with their count. So a burst of
+    identical failures gives one mail, and a steady stream at most one mail per min_interval.
+    Only the first error of a mail gets a screenshot.
+
+    Queued errors are sent right away on close, which runs at process exit.
+    Settings default to the constants from get_email_settings, read when the first mail is sent.
+    """
+
+    def __init__(
+        self,
+        settings: EmailSettings | None = None,
+        batch_seconds: float = config.ERROR_EMAIL_BATCH_SECONDS,
+        min_interval: float = config.ERROR_EMAIL_MIN_INTERVAL,
+    ):
+        self.settings = settings
+        self.batch_seconds = batch_seconds
+        self.min_interval = min_interval
+        self.sent = 0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._screenshot_taken = False
+        self._last_sent: float | None = None
+        self._thread = threading.Thread(target=self._run, name="error-mailer", daemon=True)
+        self._thread.start()
+
+    def submit(self, error: ProcessError | BusinessError, add_screenshot: bool = False, process_name: str | None = None):
+        """Queue the error for the next mail, without waiting for it to be sent."""
+        screenshot = None
+
+        # The screen shows the failure now, not when the mail goes out, so this stays on the caller's thread
+        if add_screenshot:
+            with self._lock:
+                take_screenshot = not self._screenshot_taken
+                self._screenshot_taken = True
+
+            if take_screenshot:
+                try:
+                    screenshot = grab_screenshot()
+
+                except Exception as e:
+                    logger.warning(f"Could not grab a screenshot for the error email: {e}")
+
+        self._queue.put(_ReportedError(process_name=process_name, error_dict=error.__dictinfo__(), screenshot=screenshot))
+
+    def close(self, timeout: float = config.ERROR_EMAIL_CLOSE_TIMEOUT):
+        """Send what is queued now, and stop the worker."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            reported = self._queue.get()
+
+            if reported is _STOP:
+                return
+
+            batch = [reported]
+            deadline = time.monotonic() + self.batch_seconds
+
+            if self._last_sent is not None:
+                deadline = max(deadline, self._last_sent + self.min_interval)
+
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    reported = self._queue.get(timeout=remaining)
+
+                except queue.Empty:
+                    break
+
+                if reported is _STOP:
+                    stopping = True
+                    break
+
+                batch.append(reported)
+
+            self._send(batch)
+
+    def _send(self, batch: list[_ReportedError]):
+        errors: dict[tuple, _ReportedError] = {}
+
+        for reported in batch:
+            key = (reported.process_name, reported.error_dict.get("type"), reported.error_dict.get("message"))
+            grouped = errors.get(key)
+
+            if grouped is None:
+                errors[key] = reported
+
+            else:
+                grouped.count += 1
+                grouped.last_seen = reported.last_seen
+                grouped.screenshot = grouped.screenshot or reported.screenshot
+
+        with self._lock:
+            self._screenshot_taken = False
+
+        self._last_sent = time.monotonic()
+
+        try:
+            settings = self.settings or get_email_settings()
+            msg = compose_error_email(list(errors.values()), settings)
+
+            with smtplib.SMTP(settings.smtp_server, settings.smtp_port) as smtp:
+                if settings.starttls:
+                    smtp.starttls()
+
+                smtp.send_message(msg)
+
+            self.sent += 1
+
+        except Exception as e:
+            logger.error(f"Could not send the error email for {len(batch)} errors: {e}")
+
+
+_STOP = object()
+
+_MAILER: ErrorMailer | None = None
+_MAILER_LOCK = threading.Lock()
+
+
+def get_error_mailer() -> ErrorMailer:
+    """Return the process's ErrorMailer, starting it on first use."""
+    global _MAILER  # pylint: disable=global-statement
+
+    with _MAILER_LOCK:
+        if _MAILER is None:
+            _MAILER = ErrorMailer()
+
+        return _MAILER
+
+
+@atexit.register
+def close_error_mailer() -> None:
+    """Send any queued error emails and stop the mailer. Runs automatically at process exit."""
+    global _MAILER  # pylint: disable=global-statement
+
+    with _MAILER_LOCK:
+        mailer, _MAILER = _MAILER, None
+
+    if mailer is not None:
+        mailer.close()
+
+
+def compose_error_email(errors: list[_ReportedError], settings: EmailSettings) -> EmailMessage:
+    """Build one mail listing the errors with their counts, and the first screenshot among them."""
+    process_names = sorted({reported.process_name for reported in errors if reported.process_name})
+    occurrences = sum(reported.count for reported in errors)
+
+    subject = "Error screenshot" + (f": {', '.join(process_names)}" if process_names else "")
+
+    if occurrences > 1:
+        subject += f" ({occurrences} errors)"
+
     msg = EmailMessage()
-    msg["to"] = error_email
-    msg["from"] = error_sender
-    msg["subject"] = "Error screenshot" + f": {process_name}" if process_name else ""
+    msg["to"] = settings.recipient
+    msg["from"] = settings.sender
+    msg["subject"] = subject
 
-    # Create an HTML message with the exception and screenshot
-    error_dict = error.__dictinfo__()
+    # Create an HTML message with the exceptions and screenshot
+    sections = []
 
-    if add_screenshot:
-        screenshot = grab_screenshot()
-        html_message = f"""
-                <html>
-                    <body>
-                        <p>Error type: {error_dict["type"]}</p>
-                        <p>Error message: {error_dict["message"]}</p>
-                        <p>{error_dict["traceback"]}</p>
-                        <img src="data:image/png;base64,{screenshot}" alt="Screenshot">
-                    </body>
-                </html>
-            """
-    else:
-        html_message = f"""
+    for reported in errors:
+        error_dict = reported.error_dict
+        section = f"""
+                        <p>Error type: {html.escape(str(error_dict.get("type")))}</p>
+                        <p>Error message: {html.escape(str(error_dict.get("message")))}</p>"""
+
+        if reported.count > 1:
+            section += f"""
+                        <p>Occurred {reported.count} times, from {reported.first_seen:%H:%M:%S} to {reported.last_seen:%H:%M:%S}</p>"""
+
+        section += f"""
+                        <p>{html.escape(str(error_dict.get("traceback", "")))}</p>"""
+
+        sections.append(section)
+
+    screenshot = next((reported.screenshot for reported in errors if reported.screenshot), None)
+
+    if screenshot:
+        sections.append(f"""
+                        <img src="data:image/png;base64,{screenshot}" alt="Screenshot">""")
+
+    html_message = f"""
                 <html>
-                    <body>
-                        <p>Error type: {error_dict["type"]}</p>
-                        <p>Error message: {error_dict["message"]}</p>
-                        <p>{error_dict["traceback"]}</p>
+                    <body>{"<hr>".join(sections)}
                     </body>
                 </html>
             """
@@ -119,10 +326,7 @@ def send_error_email(
     msg.set_content("Please enable HTML to view this message.")
     msg.add_alternative(html_message, subtype="html")
 
-    # Send message
-    with smtplib.SMTP(smtp_server, smtp_port) as smtp:
-        smtp.starttls()
-        smtp.send_message(msg)
+    return msg
 
 
 def grab_screenshot() -> str:
@@ -1,6 +1,166 @@
 """Module to handle process finalization"""
 
+import datetime
+import logging
+import os
+import re
+from collections.abc import Iterator
+from io import BytesIO
+
+from mbu_rpa_core.exceptions import BusinessError
+from openpyxl import load_workbook
+
+from helpers import config
+from processes.process_item import (
+    SHEET_NAME,
+    excel_file_exists,
+    format_excel_file,
+    get_sharepoint_client,
+    server_relative_url,
+    upload_excel_file,
+)
+from processes.queue_handler import get_week_config
+
+logger = logging.getLogger(__name__)
+
 
 def finalize_process():
-    """Function to handle process finalization"""
-    return
+    """
+    Function to handle process finalization.
+    When weeks were sharded, merges every complete set of shard workbooks in the folder into its
+    final workbook, whichever week it belongs to, and deletes shards left over from a merged week.
+    """
+
+    if not config.SHARD_BY:
+        return
+
+    form_config, formular_mapping, _, _ = get_week_config(datetime.date.today())
+
+    folder_name = form_config["folder_name"]
+
+    sharepoint_api = get_sharepoint_client(form_config["site_name"])
+
+    files_in_sharepoint = sharepoint_api.fetch_files_list(folder_name=folder_name)
+    if files_in_sharepoint is None:
+        raise RuntimeError(f"Could not list the files in SharePoint folder {folder_name}")
+
+    file_names = [f["Name"] for f in files_in_sharepoint]
+
+    shard_sets = _find_shard_sets(file_names, config.MODERSMAAL_CONFIG["excel_file_name"])
+    if not shard_sets:
+        logger.info("No shard files, nothing to finalize")
+
+        return
+
+    # Force column order according to formular_mapping
+    column_order = list(formular_mapping.values())
+
+    incomplete = []
+
+    for excel_file_name, shards in shard_sets.items():
+        if excel_file_name in file_names:
+            # A shard item retried after the merge uploads its shard again
+            logger.info(f"Merged excel file {excel_file_name} already exists, deleting {len(shards)} leftover shard files")
+            _delete_shard_files(sharepoint_api, folder_name, shards)
+
+            continue
+
+        shard_counts = {count for _, count, _ in shards}
+        if len(shard_counts) != 1 or len(shards) != shard_counts.pop():
+            incomplete.append(f"{len(shards)} shard files of {excel_file_name}")
+
+            continue
+
+        _merge_shard_files(sharepoint_api, folder_name, excel_file_name, shards, column_order)
+
+    if incomplete:
+        raise BusinessError(f"Only {', '.join(incomplete)} are in SharePoint, not merging yet")
+
+
+def _merge_shard_files(sharepoint_api, folder_name: str, excel_file_name: str, shards: list[tuple[int, int, str]], column_order: list[str]):
+    """Merge a complete set of shard files into the final workbook, then delete the shards."""
+
+    logger.info(f"Merging {len(shards)} shard files into {excel_file_name}")
+
+    shard_contents = []
+
+    for _, _, shard_file_name in shards:
+        content = sharepoint_api.fetch_file_using_open_binary(shard_file_name, folder_name)
+        if content is None:
+            raise RuntimeError(f"Could not download shard file {shard_file_name}")
+
+        shard_contents.append(content)
+
+    merged_rows = (
+        row
+        for content in shard_contents
+        for row in _iter_workbook_rows(content)
+    )
+
+    upload_excel_file(sharepoint_api, merged_rows, column_order, folder_name, excel_file_name, formatted=config.EXCEL_FORMAT_LOCALLY)
+
+    if not config.EXCEL_FORMAT_LOCALLY:
+        format_excel_file(sharepoint_api, folder_name, excel_file_name)
+
+    # The shards are the only copy until the merged workbook is confirmed uploaded
+    if not excel_file_exists(sharepoint_api, folder_name, excel_file_name):
+        raise RuntimeError(f"Merged excel file {excel_file_name} was not uploaded, keeping the shard files")
+
+    _delete_shard_files(sharepoint_api, folder_name, shards)
+
+    logger.info(f"Merged {len(shards)} shard files into {excel_file_name}")
+
+
+def _delete_shard_files(sharepoint_api, folder_name: str, shards: list[tuple[int, int, str]]):
+    """Delete shard files, logging the ones that could not be deleted."""
+
+    for _, _, shard_file_name in shards:
+        file_url = server_relative_url(sharepoint_api, folder_name, shard_file_name)
+
+        try:
+            sharepoint_api.ctx.web.get_file_by_server_relative_url(file_url).delete_object().execute_query()
+
+        except Exception as e:
+            logger.info(f"Error when trying to delete shard file {shard_file_name}: {e}")
+
+
+def _iter_workbook_rows(content: bytes) -> Iterator[dict]:
+    """Yield the rows of a submissions workbook as dicts keyed by the header row, reading one row at a time."""
+
+    workbook = load_workbook(BytesIO(content), read_only=True)
+
+    try:
+        rows = workbook[SHEET_NAME].iter_rows(values_only=True)
+        header = next(rows, ())
+
+        for values in rows:
+            yield dict(zip(header, values))
+
+    finally:
+        workbook.close()
+
+
+def _find_shard_sets(file_names: list[str], excel_file_name_template: str) -> dict[str, list[tuple[int, int, str]]]:
+    """
+    Return the shard files of every week in the folder, as (index, count, file name) ordered by index,
+    keyed by the final workbook's file name. The template is the configured excel_file_name, whose
+    week placeholders match any date.
+    """
+
+    stem, ext = os.path.splitext(excel_file_name_template)
+
+    week_stem = re.escape(stem)
+    for placeholder in ("monday_last_week", "sunday_last_week"):
+        week_stem = week_stem.replace(re.escape(placeholder), r"\d{4}-\d{2}-\d{2}")
+
+    pattern = re.compile(rf"({week_stem}) \(del (\d+) af (\d+)\){re.escape(ext)}")
+
+    shard_sets = {}
+
+    for file_name in file_names:
+        match = pattern.fullmatch(file_name)
+
+        if match:
+            shard_sets.setdefault(f"{match.group(1)}{ext}", []).append((int(match.group(2)), int(match.group(3)), file_name))
+
+    return {excel_file_name: sorted(shards) for excel_file_name, shards in shard_sets.items()}
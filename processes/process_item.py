@@ -2,16 +2,19 @@
 
 import os
 import logging
+import threading
+import time
 
-from io import BytesIO
-
-import pandas as pd
+from collections.abc import Iterable, Sized
 
 from dotenv import load_dotenv
 
 from mbu_msoffice_integration.sharepoint_class import Sharepoint
+from office365.runtime.client_request_exception import ClientRequestException
 
-from helpers import config
+from helpers import config, metrics
+from helpers.excel_writer import write_submissions_workbook
+from helpers.graph_upload import GraphUploader
 
 load_dotenv()  # Loads variables from .env
 
@@ -20,6 +23,21 @@ SHAREPOINT_DOCUMENT_LIBRARY = "Delte dokumenter"
 
 SHEET_NAME = "Besvarelser"
 
+# Sorting and styling of the uploaded workbook, applied by format_and_sort_excel_file or locally while writing
+WORKBOOK_FORMATTING = {
+    "sorting_keys": [
+        {"key": "Ønsket sprog", "ascending": True, "type": "str"},
+        {"key": "A", "ascending": False, "type": "int"}
+    ],
+    "bold_rows": [1],
+    "align_horizontal": "left",
+    "align_vertical": "top",
+    "italic_rows": None,
+    "font_config": None,
+    "column_widths": 100,
+    "freeze_panes": "A2",
+}
+
 SHAREPOINT_KWARGS = {
     "tenant": os.getenv("TENANT"),
     "client_id": os.getenv("CLIENT_ID"),
@@ -27,6 +45,15 @@ SHAREPOINT_KWARGS = {
     "cert_path": os.getenv("GRAPH_CERT_PEM"),
 }
 
+# (site_name, document_library) -> (client, time.monotonic() when authenticated)
+_SHAREPOINT_CLIENTS: dict[tuple[str, str], tuple[Sharepoint, float]] = {}
+_SHAREPOINT_CLIENTS_LOCK = threading.Lock()
+_GRAPH_UPLOADER: GraphUploader | None = None
+
+# (site_name, document_library, folder_name) -> (file names, time.monotonic() when listed)
+_FOLDER_LISTINGS: dict[tuple[str, str, str], tuple[set[str], float]] = {}
+_FOLDER_LISTINGS_LOCK = threading.Lock()
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,83 +75,241 @@ def process_item(item_data: dict):
         return "No new submissions for the given week"
 
     try:
-        sharepoint_api = Sharepoint(
-            tenant=SHAREPOINT_KWARGS["tenant"],
-            client_id=SHAREPOINT_KWARGS["client_id"],
-            thumbprint=SHAREPOINT_KWARGS["thumbprint"],
-            cert_path=SHAREPOINT_KWARGS["cert_path"],
-            site_url=SHAREPOINT_SITE_URL,
-            site_name=site_name,
-            document_library=SHAREPOINT_DOCUMENT_LIBRARY,
-        )
+        sharepoint_api = get_sharepoint_client(site_name)
 
     except Exception as e:
         logger.info(f"Error when trying to authenticate: {e}")
 
-    try:
-        files_in_sharepoint = sharepoint_api.fetch_files_list(folder_name=folder_name)
-        file_names = [f["Name"] for f in files_in_sharepoint]
-
-    except Exception as e:
-        logger.info(f"Error when trying to fetch existing files in SharePoint: {e}")
-
-    if excel_file_name in file_names:
+    if excel_file_exists(sharepoint_api, folder_name, excel_file_name):
         logger.info("Excel file already exists, process completed")
 
         return "Excel file already exists"
 
+    # A shard retried after finalize_process merged its week must not be uploaded again
+    shard = forn_config.get("shard")
+    if shard and excel_file_exists(sharepoint_api, folder_name, shard["final_excel_file_name"]):
+        logger.info("Merged excel file already exists, process completed")
+
+        return "Merged excel file already exists"
+
     # Force column order according to formular_mapping
     column_order = list(formular_mapping.values())
 
-    normalized_submissions = [
-        {col: row.get(col, None) for col in column_order}
-        for row in new_submissions
-    ]
+    # Shards are formatted and sorted once, after finalize_process has merged them
+    is_shard = bool(shard)
+    format_locally = config.EXCEL_FORMAT_LOCALLY and not is_shard
+
+    upload_excel_file(sharepoint_api, new_submissions, column_order, folder_name, excel_file_name, formatted=format_locally)
+
+    if is_shard or format_locally:
+        return "Process completed without exceptions"
+
+    format_excel_file(sharepoint_api, folder_name, excel_file_name)
+
+    return "Process completed without exceptions"
+
+
+def get_sharepoint_client(site_name: str) -> Sharepoint:
+    """
+    Return an authenticated Sharepoint client for the site, reusing the one from an earlier item.
+    Clients are replaced after SHAREPOINT_CLIENT_MAX_AGE seconds, before their access token runs out.
+    """
 
-    all_submissions_df = pd.DataFrame(normalized_submissions, columns=column_order)
+    key = (site_name, SHAREPOINT_DOCUMENT_LIBRARY)
 
-    # Ensure no extra columns slipped in
-    all_submissions_df = all_submissions_df[column_order]
+    with _SHAREPOINT_CLIENTS_LOCK:
+        cached = _SHAREPOINT_CLIENTS.get(key)
 
-    excel_stream = BytesIO()
-    all_submissions_df.to_excel(
-        excel_stream,
-        index=False,
-        engine="openpyxl",
-        sheet_name=SHEET_NAME
+        if cached and time.monotonic() - cached[1] < config.SHAREPOINT_CLIENT_MAX_AGE:
+            return cached[0]
+
+        sharepoint_api = create_sharepoint_client(site_name)
+
+        # The Sharepoint class swallows authentication errors and leaves ctx unset, so those are not kept
+        if sharepoint_api.ctx is not None:
+            _SHAREPOINT_CLIENTS[key] = (sharepoint_api, time.monotonic())
+
+        return sharepoint_api
+
+
+def clear_sharepoint_clients():
+    """Drop all cached Sharepoint clients and the Graph uploader."""
+
+    global _GRAPH_UPLOADER  # pylint: disable=global-statement
+
+    with _SHAREPOINT_CLIENTS_LOCK:
+        _SHAREPOINT_CLIENTS.clear()
+        _GRAPH_UPLOADER = None
+
+
+def get_graph_uploader() -> GraphUploader:
+    """Return the shared uploader for chunked uploads, created on first use."""
+
+    global _GRAPH_UPLOADER  # pylint: disable=global-statement
+
+    with _SHAREPOINT_CLIENTS_LOCK:
+        if _GRAPH_UPLOADER is None:
+            _GRAPH_UPLOADER = GraphUploader(
+                tenant=SHAREPOINT_KWARGS["tenant"],
+                client_id=SHAREPOINT_KWARGS["client_id"],
+                thumbprint=SHAREPOINT_KWARGS["thumbprint"],
+                cert_path=SHAREPOINT_KWARGS["cert_path"],
+                site_url=SHAREPOINT_SITE_URL,
+            )
+
+        return _GRAPH_UPLOADER
+
+
+def create_sharepoint_client(site_name: str) -> Sharepoint:
+    """Authenticate a Sharepoint client for the document library of the given site."""
+
+    return Sharepoint(
+        tenant=SHAREPOINT_KWARGS["tenant"],
+        client_id=SHAREPOINT_KWARGS["client_id"],
+        thumbprint=SHAREPOINT_KWARGS["thumbprint"],
+        cert_path=SHAREPOINT_KWARGS["cert_path"],
+        site_url=SHAREPOINT_SITE_URL,
+        site_name=site_name,
+        document_library=SHAREPOINT_DOCUMENT_LIBRARY,
     )
-    excel_stream.seek(0)
 
-    try:
-        sharepoint_api.upload_file_from_bytes(
-            binary_content=excel_stream.getvalue(),
-            file_name=excel_file_name,
-            folder_name=folder_name,
-        )
 
-    except Exception as e:
-        logger.info(f"Error when trying to upload excel file to SharePoint: {e}")
+def excel_file_exists(sharepoint_api: Sharepoint, folder_name: str, excel_file_name: str) -> bool:
+    """
+    Check whether the file is in the folder with a single lookup by path.
+    If the lookup fails for any other reason than the file not existing, the folder listing is checked instead.
+    """
+
+    file_url = server_relative_url(sharepoint_api, folder_name, excel_file_name)
 
-    logger.info("Formatting and sorting excel file")
     try:
-        sharepoint_api.format_and_sort_excel_file(
-            folder_name=folder_name,
-            excel_file_name=excel_file_name,
-            sheet_name=SHEET_NAME,
-            sorting_keys=[
-                {"key": "Ønsket sprog", "ascending": True, "type": "str"},
-                {"key": "A", "ascending": False, "type": "int"}
-            ],
-            bold_rows=[1],
-            align_horizontal="left",
-            align_vertical="top",
-            italic_rows=None,
-            font_config=None,
-            column_widths=100,
-            freeze_panes="A2",
-        )
+        sharepoint_api.ctx.web.get_file_by_server_relative_url(file_url).get().execute_query()
+
+        return True
+
+    except ClientRequestException as e:
+        if e.response is not None and e.response.status_code == 404:
+            return False
+
+        logger.info(f"Error when looking up {excel_file_name} in SharePoint, checking the folder listing: {e}")
 
     except Exception as e:
-        logger.info(f"Error when trying format and sort excel file: {e}")
+        logger.info(f"Error when looking up {excel_file_name} in SharePoint, checking the folder listing: {e}")
 
-    return "Process completed without exceptions"
+    return excel_file_name in _get_folder_listing(sharepoint_api, folder_name)
+
+
+def clear_folder_listings():
+    """Drop all cached folder listings."""
+
+    with _FOLDER_LISTINGS_LOCK:
+        _FOLDER_LISTINGS.clear()
+
+
+def _get_folder_listing(sharepoint_api: Sharepoint, folder_name: str) -> set[str]:
+    """Return the file names in the folder, listed at most once per FOLDER_LISTING_CACHE_TTL seconds."""
+
+    key = (sharepoint_api.site_name, sharepoint_api.document_library, folder_name)
+
+    with _FOLDER_LISTINGS_LOCK:
+        cached = _FOLDER_LISTINGS.get(key)
+
+        if cached and time.monotonic() - cached[1] < config.FOLDER_LISTING_CACHE_TTL:
+            return cached[0]
+
+        files_in_sharepoint = sharepoint_api.fetch_files_list(folder_name=folder_name)
+        if files_in_sharepoint is None:
+            raise RuntimeError(f"Could not fetch existing files in SharePoint folder {folder_name}")
+
+        file_names = {f["Name"] for f in files_in_sharepoint}
+        _FOLDER_LISTINGS[key] = (file_names, time.monotonic())
+
+        return file_names
+
+
+def server_relative_url(sharepoint_api: Sharepoint, folder_name: str, file_name: str) -> str:
+    """Server-relative URL of a file in the client's document library."""
+
+    return f"/{sharepoint_api.site_type}/{sharepoint_api.site_name}/{sharepoint_api.document_library}/{folder_name}/{file_name}"
+
+
+def upload_excel_file(
+    sharepoint_api: Sharepoint,
+    submissions: Iterable[dict],
+    column_order: list[str],
+    folder_name: str,
+    excel_file_name: str,
+    formatted: bool = False,
+):
+    """
+    Write the submissions to a workbook and upload it to the folder.
+    Only the columns in column_order are written, in that order, and missing ones are left empty.
+    If formatted is set, the workbook is sorted and formatted before the upload, as format_excel_file would.
+    """
+
+    formatting = WORKBOOK_FORMATTING if formatted else None
+
+    with metrics.stage("excel_build", formatted=formatted) as build:
+        excel_file = write_submissions_workbook(submissions, column_order, SHEET_NAME, formatting)
+        size = excel_file.seek(0, os.SEEK_END)
+        excel_file.seek(0)
+
+        build.add(bytes=size)
+
+        if isinstance(submissions, Sized):
+            build.add(rows=len(submissions))
+
+    with excel_file, metrics.stage("upload", bytes=size) as upload:
+        try:
+            # Large workbooks go in resumable chunks straight from the file, the rest in one request
+            if config.UPLOAD_CHUNKED_MIN_SIZE is not None and size >= config.UPLOAD_CHUNKED_MIN_SIZE:
+                upload.fields["method"] = "chunked"
+
+                get_graph_uploader().upload(
+                    excel_file,
+                    size,
+                    site_name=sharepoint_api.site_name,
+                    document_library=sharepoint_api.document_library,
+                    folder_name=folder_name,
+                    file_name=excel_file_name,
+                )
+
+            else:
+                upload.fields["method"] = "single"
+
+                sharepoint_api.upload_file_from_bytes(
+                    binary_content=excel_file.read(),
+                    file_name=excel_file_name,
+                    folder_name=folder_name,
+                )
+
+        except Exception as e:
+            upload.fields["failed"] = True
+
+            logger.info(f"Error when trying to upload excel file to SharePoint: {e}")
+
+            return
+
+    # upload_file_from_bytes swallows its own errors, so a cached listing of the folder is dropped
+    # rather than trusted to hold the file, and the next lookup lists the folder again
+    with _FOLDER_LISTINGS_LOCK:
+        _FOLDER_LISTINGS.pop((sharepoint_api.site_name, sharepoint_api.document_library, folder_name), None)
+
+
+def format_excel_file(sharepoint_api: Sharepoint, folder_name: str, excel_file_name: str):
+    """Sort the uploaded workbook by language and serial number, and format it."""
+
+    logger.info("Formatting and sorting excel file")
+    with metrics.stage("remote_format") as span:
+        try:
+            sharepoint_api.format_and_sort_excel_file(
+                folder_name=folder_name,
+                excel_file_name=excel_file_name,
+                sheet_name=SHEET_NAME,
+                **WORKBOOK_FORMATTING,
+            )
+
+        except Exception as e:
+            span.fields["failed"] = True
+
+            logger.info(f"Error when trying format and sort excel file: {e}")
@@ -5,6 +5,12 @@ import asyncio
 import logging
 import json
 import copy
+import hashlib
+import itertools
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
 
 from automation_server_client import Workqueue
 
@@ -12,7 +18,11 @@ import datetime
 
 from helpers import config
 
-from helpers import helper_functions
+from helpers import helper_functions, metrics
+from helpers.adaptive_limiter import AdaptiveLimiter, get_retry_after
+from helpers.submission_cache import SubmissionCache
+
+SHARD_LANGUAGE_COLUMN = "Ønsket sprog"
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +34,68 @@ def retrieve_items_for_queue() -> list[dict]:
 
     db_conn_string = os.getenv("DBCONNECTIONSTRINGPROD")
 
+    # today = datetime.date(2025, 9, 22)
+    today = datetime.date.today()
+
+    form_config, formular_mapping, monday_last_week, sunday_last_week = get_week_config(today)
+
+    os2_webform_id = form_config["os2_webform_id"]
+
+    if config.SUBMISSION_CACHE_PATH:
+        try:
+            submissions = _retrieve_submissions_cached(db_conn_string, os2_webform_id, formular_mapping, monday_last_week, sunday_last_week)
+
+        except sqlite3.Error as e:
+            logger.warning(f"Submission cache unavailable, fetching directly from the database: {e}")
+
+            submissions = _retrieve_submissions(db_conn_string, os2_webform_id, formular_mapping, monday_last_week, sunday_last_week)
+
+    else:
+        submissions = _retrieve_submissions(db_conn_string, os2_webform_id, formular_mapping, monday_last_week, sunday_last_week)
+
+    logger.info(f"OS2 submissions looped. {len(submissions)} in the previous week.")
+
+    if config.SHARD_BY and submissions:
+        shards = shard_submissions(submissions, config.SHARD_BY, config.SHARD_SIZE)
+
+        logger.info(f"Week split into {len(shards)} work items by {config.SHARD_BY}.")
+
+        queue_items = []
+
+        for index, (shard_key, shard_rows) in enumerate(shards, start=1):
+            shard_config = dict(form_config)
+            shard_config["excel_file_name"] = shard_file_name(form_config["excel_file_name"], index, len(shards))
+            shard_config["shard"] = {
+                "index": index,
+                "count": len(shards),
+                "final_excel_file_name": form_config["excel_file_name"],
+            }
+
+            queue_items.append({
+                "reference": f"{os2_webform_id}_{today}_{shard_key}",
+                "data": {"config": shard_config, "submissions": shard_rows},
+            })
+
+    else:
+        work_item_data = {
+            "reference": f"{os2_webform_id}_{today}",
+            "data": {"config": form_config, "submissions": submissions},
+        }
+
+        queue_items = [work_item_data]
+
+    print()
+    print()
+
+    return queue_items
+
+
+def get_week_config(today: datetime.date) -> tuple[dict, dict, datetime.date, datetime.date]:
+    """
+    Build the form config for the week before today.
+    Returns the config without its formular mapping, the mapping, and last week's monday and sunday.
+    """
+
     form_config = copy.deepcopy(config.MODERSMAAL_CONFIG)
 
     ### FOR DEV TESTING ONLY - OVERRIDE SITE AND FOLDER NAME TO AVOID POLLUTING ACTUAL FOLDERS ###
@@ -33,72 +105,208 @@ def retrieve_items_for_queue() -> list[dict]:
     #     form_config["folder_name"] = "Automation_Server"
     ### FOR DEV TESTING ONLY - OVERRIDE SITE AND FOLDER NAME TO AVOID POLLUTING ACTUAL FOLDERS ###
 
-    submissions = []
-
-    # today = datetime.date(2025, 9, 22)
-    today = datetime.date.today()
     monday_last_week = today - datetime.timedelta(days=today.weekday() + 7)
     sunday_last_week = today - datetime.timedelta(days=today.weekday() + 1)
 
-    os2_webform_id = form_config["os2_webform_id"]
-
     form_config["excel_file_name"] = str(form_config["excel_file_name"]).replace("monday_last_week", monday_last_week.strftime("%Y-%m-%d")).replace("sunday_last_week", sunday_last_week.strftime("%Y-%m-%d"))
 
-    formular_mapping = form_config["formular_mapping"]
-    del form_config["formular_mapping"]
+    formular_mapping = form_config.pop("formular_mapping")
 
-    logger.info("STEP 1 - Fetching all active submissions.")
-    all_submissions = helper_functions.get_forms_data(
-        conn_string=db_conn_string,
-        form_type=os2_webform_id,
-    )
+    return form_config, formular_mapping, monday_last_week, sunday_last_week
+
+
+def shard_submissions(submissions: list[dict], shard_by: str, shard_size: int) -> list[tuple[str, list[dict]]]:
+    """
+    Split the week's submissions into (shard key, submissions) pairs, in a deterministic order.
+
+    "language" makes one shard per Ønsket sprog, sorted by key, and "size" makes
+    shards of shard_size submissions in the given order. The shard key ends the reference,
+    so languages that give the same key, such as "Dari/Persisk" and "Dari Persisk", share a shard.
+    """
+
+    if shard_by == "language":
+        languages: dict[str, list[dict]] = {}
+
+        for row in submissions:
+            language = str(row.get(SHARD_LANGUAGE_COLUMN) or "Ukendt")
+            languages.setdefault(f"sprog-{_slugify(language)}", []).append(row)
+
+        return [(shard_key, languages[shard_key]) for shard_key in sorted(languages)]
+
+    if shard_by == "size":
+        return [
+            (f"del-{start // shard_size + 1:03d}", submissions[start:start + shard_size])
+            for start in range(0, len(submissions), shard_size)
+        ]
+
+    raise ValueError(f"Unknown shard strategy: {shard_by}")
+
+
+def shard_file_name(excel_file_name: str, index: int, count: int) -> str:
+    """Name of the workbook written for one shard, e.g. "Dataudtræk - ... (del 2 af 5).xlsx"."""
+
+    stem, ext = os.path.splitext(excel_file_name)
+
+    return f"{stem} (del {index} af {count}){ext}"
+
+
+def _slugify(value: str) -> str:
+    return re.sub(r"\W+", "-", value.lower()).strip("-") or "ukendt"
 
-    logger.info(f"OS2 submissions retrieved. {len(all_submissions)} total submissions found.")
+
+def _retrieve_submissions(conn_string: str, form_type: str, mapping: dict, start: datetime.date, end: datetime.date) -> list[dict]:
+    """Fetch the submissions completed between start and end from the database and transform them."""
+
+    # The database filters on form_submitted_date while the week is decided by the completed
+    # timestamp below, so the database window is padded to cover timezone and midnight offsets
+    margin = datetime.timedelta(days=config.SUBMISSION_WINDOW_MARGIN_DAYS)
+
+    logger.info("STEP 1 - Fetching last weeks' active submissions.")
+    all_submissions = helper_functions.iter_forms_data(
+        conn_string=conn_string,
+        form_type=form_type,
+        since=start - margin,
+        until=end + datetime.timedelta(days=1) + margin,
+    )
 
     logger.info("STEP 2 - Looping fetched submissions, looking for last weeks' submissions.")
-    for form in all_submissions:
-        form_serial_number = form["entity"]["serial"][0]["value"]
+    total_submissions = 0
+    week_forms = []
 
-        completed_str = form["entity"]["completed"][0]["value"]
+    with metrics.stage("date_filter") as span:
+        for form in all_submissions:
+            total_submissions += 1
 
-        if completed_str:
-            completed_time = datetime.datetime.fromisoformat(completed_str).date()
+            if _completed_between(form, start, end):
+                week_forms.append(form)
 
-            if monday_last_week <= completed_time <= sunday_last_week:
-                transformed_row = helper_functions.transform_form_submission(form_serial_number, form, formular_mapping)
+        span.add(rows=len(week_forms))
 
-                submissions.append(transformed_row)
+    logger.info(f"OS2 submissions retrieved. {total_submissions} total submissions found.")
 
-    logger.info(f"OS2 submissions looped. {len(submissions)} in the previous week.")
+    with metrics.stage("transform", rows=len(week_forms)):
+        submissions = helper_functions.transform_columnar(week_forms, mapping).to_dict(orient="records")
 
-    work_item_data = {
-        "reference": f"{os2_webform_id}_{today}",
-        "data": {"config": form_config, "submissions": submissions},
-    }
+    return submissions
 
-    if "formular_mapping" in form_config:
-        del form_config["formular_mapping"]
 
-    queue_items = [work_item_data]
+def _retrieve_submissions_cached(conn_string: str, form_type: str, mapping: dict, start: datetime.date, end: datetime.date) -> list[dict]:
+    """
+    Like _retrieve_submissions, but through the local submission cache.
+    Only submissions from SUBMISSION_WINDOW_MARGIN_DAYS before the cache's watermark onwards are fetched,
+    so rows that reach the database late are still picked up, unless the week lies before what the
+    cache holds, in which case everything from the week onwards is fetched. Submissions purged since
+    they were cached are dropped, as are rows submitted before the window this run needs.
+    """
 
-    print()
-    print()
+    margin = datetime.timedelta(days=config.SUBMISSION_WINDOW_MARGIN_DAYS)
+    window_since = datetime.datetime.combine(start - margin, datetime.time())
 
-    return queue_items
+    with SubmissionCache(config.SUBMISSION_CACHE_PATH) as cache:
+        covered_since, watermark = cache.get_sync_state(form_type, mapping)
+
+        if covered_since is None or window_since < covered_since:
+            fetch_since = window_since
+            covered_since = window_since
+
+        else:
+            # Rows are upserted by form_id, so refetching the margin only replaces them
+            fetch_since = max(watermark - margin, covered_since) if watermark else covered_since
+
+        logger.info(f"STEP 1 - Fetching submissions since {fetch_since} into the local cache.")
+        new_rows = helper_functions.iter_form_rows(
+            conn_string=conn_string,
+            form_type=form_type,
+            since=fetch_since,
+        )
+
+        total_submissions = 0
+        transform = metrics.Stage("transform", rows=0)
+
+        for batch in itertools.batched(new_rows, config.DB_FETCH_BATCH_SIZE):
+            form_ids, submitted_dates, forms = zip(*batch)
+
+            with transform:
+                transformed_rows = helper_functions.transform_columnar(forms, mapping).to_dict(orient="records")
+
+            transform.add(rows=len(transformed_rows))
+
+            latest = cache.store(form_type, mapping, zip(form_ids, submitted_dates, transformed_rows))
+            watermark = max(watermark, latest) if watermark else latest
+
+            total_submissions += len(batch)
+
+        transform.record()
+
+        cache.set_sync_state(form_type, mapping, covered_since, watermark)
+
+        logger.info(f"OS2 submissions retrieved. {total_submissions} new submissions cached.")
+
+        # Earlier weeks are not needed again, and their personal data is not kept
+        cache.prune(form_type, window_since)
+
+        purged = cache.delete(form_type, helper_functions.get_purged_form_ids(conn_string, form_type, since=window_since))
+        if purged:
+            logger.info(f"{purged} purged submissions dropped from the local cache.")
+
+        logger.info("STEP 2 - Reading last weeks' submissions from the local cache.")
 
+        with metrics.stage("date_filter") as span:
+            submissions = cache.get_completed_between(form_type, start, end)
+            span.add(rows=len(submissions))
 
-def create_sort_key(item: dict) -> str:
+        return submissions
+
+
+def _completed_between(form: dict, start: datetime.date, end: datetime.date) -> bool:
+    """Check whether the form was completed between start and end, both inclusive."""
+    completed_str = form["entity"]["completed"][0]["value"]
+
+    if not completed_str:
+        return False
+
+    completed_time = datetime.datetime.fromisoformat(completed_str).date()
+
+    return start <= completed_time <= end
+
+
+@dataclass
+class QueueEntry:
+    """An item prepared for adding to the workqueue"""
+
+    reference: str
+    data: dict
+
+
+def order_items(items: list[dict], strategy: str = config.QUEUE_ORDERING) -> list[QueueEntry]:
     """
-    Create a sort key based on the entire JSON structure.
-    Converts the item to a sorted JSON string for consistent ordering.
+    Wrap items for the workqueue and order them by the given strategy.
+
+    "reference" sorts by reference, "content_hash" by a hash of the item's sorted JSON,
+    and "none" keeps the given order.
     """
-    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+    entries = [
+        QueueEntry(reference=str(it.get("reference") or ""), data={"item": it})
+        for it in items
+    ]
+
+    if strategy == "reference":
+        entries.sort(key=lambda entry: entry.reference)
+
+    elif strategy == "content_hash":
+        entries.sort(key=lambda entry: hashlib.sha256(json.dumps(entry.data, sort_keys=True, ensure_ascii=False).encode("utf-8")).digest())
+
+    elif strategy != "none":
+        raise ValueError(f"Unknown queue ordering strategy: {strategy}")
+
+    return entries
 
 
 async def concurrent_add(workqueue: Workqueue, items: list[dict]) -> None:
     """
     Populate the workqueue with items to be processed.
-    Uses concurrency and retries with exponential backoff.
+    Uses an adaptive concurrency limit and retries with exponential backoff,
+    honouring Retry-After from throttling responses.
 
     Args:
         workqueue (Workqueue): The workqueue to populate.
@@ -111,47 +319,65 @@ async def concurrent_add(workqueue: Workqueue, items: list[dict]) -> None:
     Raises:
         Exception: If adding an item fails after all retries.
     """
-    sem = asyncio.Semaphore(config.MAX_CONCURRENCY)
+    limiter = AdaptiveLimiter(
+        initial=config.INITIAL_CONCURRENCY,
+        minimum=1,
+        maximum=config.MAX_CONCURRENCY,
+        latency_target=config.ADD_LATENCY_TARGET,
+    )
 
-    async def add_one(it: dict):
-        reference = str(it.get("reference") or "")
-        data = {"item": it}
+    async def add_one(entry: QueueEntry):
+        reference = entry.reference
+
+        for attempt in range(1, config.MAX_RETRIES + 1):
+            async with limiter:
+                start = time.monotonic()
 
-        async with sem:
-            for attempt in range(1, config.MAX_RETRIES + 1):
                 try:
-                    await asyncio.to_thread(workqueue.add_item, data, reference)
+                    await asyncio.to_thread(workqueue.add_item, entry.data, reference)
+
+                    limiter.record_success(start)
                     logger.info(f"Added item to queue with reference: {reference}")
                     return True
 
                 except Exception as e:
-                    if attempt >= config.MAX_RETRIES:
-                        logger.error(
-                            f"Failed to add item {reference} after {attempt} attempts: {e}"
-                        )
-                        return False
+                    retry_after = get_retry_after(e)
+                    limiter.record_failure(start, retry_after)
+                    error = e
+
+            if attempt >= config.MAX_RETRIES:
+                logger.error(
+                    f"Failed to add item {reference} after {attempt} attempts: {error}"
+                )
+                return False
 
-                    backoff = config.RETRY_BASE_DELAY * (2 ** (attempt - 1))
+            backoff = max(config.RETRY_BASE_DELAY * (2 ** (attempt - 1)), retry_after or 0)
 
-                    logger.warning(
-                        f"Error adding {reference} (attempt {attempt}/{config.MAX_RETRIES}). "
-                        f"Retrying in {backoff:.2f}s... {e}"
-                    )
-                    await asyncio.sleep(backoff)
+            logger.warning(
+                f"Error adding {reference} (attempt {attempt}/{config.MAX_RETRIES}). "
+                f"Retrying in {backoff:.2f}s... {error}"
+            )
+            await asyncio.sleep(backoff)
 
     if not items:
         logger.info("No new items to add.")
         return
 
-    sorted_items = sorted(items, key=create_sort_key)
-    logger.info(
-        f"Processing {len(sorted_items)} items sorted by complete JSON structure"
-    )
+    with metrics.stage("queue_insert", items=len(items)):
+        sorted_items = order_items(items, config.QUEUE_ORDERING)
+
+        logger.info(
+            f"Processing {len(sorted_items)} items ordered by {config.QUEUE_ORDERING}"
+        )
+
+        results = await asyncio.gather(*(add_one(i) for i in sorted_items))
 
-    results = await asyncio.gather(*(add_one(i) for i in sorted_items))
     successes = sum(1 for r in results if r)
     failures = len(results) - successes
 
     logger.info(
         f"Summary: {successes} succeeded, {failures} failed out of {len(results)}"
     )
+    logger.info(
+        f"Concurrency settled at {limiter.limit:.1f} (peak {limiter.peak:.1f}, maximum {config.MAX_CONCURRENCY})"
+    )
@@ -0,0 +1,63 @@
+"""Tests for the local sorting of helpers.excel_writer against Sharepoint.format_and_sort_excel_file"""
+
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from openpyxl import load_workbook
+
+from helpers.excel_writer import write_submissions_workbook
+from processes.process_item import SHEET_NAME, WORKBOOK_FORMATTING
+
+COLUMNS = ["Serial number", "Ønsket sprog", "Skole"]
+
+# Empty languages come from [] and "[]" in the form data, and from forms without the field
+LANGUAGES = ["Somali", "", "Arabisk", None, "Dari", "", "Arabisk"]
+
+SUBMISSIONS = [
+    {"Serial number": serial, "Ønsket sprog": language, "Skole": "Tilst Skole"}
+    for serial, language in enumerate(LANGUAGES, start=1)
+]
+
+
+def _sheet_rows(content: bytes) -> list[tuple]:
+    return list(load_workbook(BytesIO(content))[SHEET_NAME].iter_rows(values_only=True))
+
+
+def _write(formatting: dict | None = None) -> bytes:
+    with write_submissions_workbook(SUBMISSIONS, COLUMNS, SHEET_NAME, formatting=formatting) as excel_file:
+        return excel_file.read()
+
+
+def test_empty_languages_sort_last():
+    rows = _sheet_rows(_write(WORKBOOK_FORMATTING))
+
+    assert [row[:2] for row in rows[1:]] == [
+        (7, "Arabisk"),
+        (3, "Arabisk"),
+        (5, "Dari"),
+        (1, "Somali"),
+        (6, None),
+        (4, None),
+        (2, None),
+    ]
+
+
+def test_local_sort_matches_the_remote_formatter():
+    sharepoint_class = pytest.importorskip("mbu_msoffice_integration.sharepoint_class")
+
+    if not hasattr(sharepoint_class.Sharepoint, "format_and_sort_excel_file"):
+        pytest.skip("mbu_msoffice_integration without format_and_sort_excel_file")
+
+    unformatted = _write()
+    uploaded = {}
+
+    # The remote formatter downloads the workbook and uploads its sorted copy
+    sharepoint = SimpleNamespace(
+        fetch_file_using_open_binary=lambda file_name, folder_name: unformatted,
+        upload_file_from_bytes=lambda content, file_name, folder_name: uploaded.update(content=content),
+    )
+
+    sharepoint_class.Sharepoint.format_and_sort_excel_file(sharepoint, "General", "test.xlsx", SHEET_NAME, **WORKBOOK_FORMATTING)
+
+    assert _sheet_rows(_write(WORKBOOK_FORMATTING)) == _sheet_rows(uploaded["content"])
@@ -0,0 +1,39 @@
+"""Tests that benchmarks.fake_ats.FakeATSServer serves the requests of automation_server_client"""
+
+import pytest
+import requests
+
+from benchmarks.fake_ats import FakeATSServer, FakeWorkqueue, client_workqueue
+
+
+@pytest.fixture
+def server():
+    with FakeATSServer() as server:
+        yield server
+
+
+def test_real_client_round_trip(server):
+    workqueue = client_workqueue(server, 1)
+
+    if workqueue is None:
+        pytest.skip("automation_server_client is not installed")
+
+    workqueue.add_item({"item": {"reference": "ref_1", "data": {}}}, "ref_1")
+
+    for item in workqueue:
+        with item:
+            item.complete("done")
+
+    assert server.rejected == []
+    assert server.status_counts(1) == {"completed": 1}
+    assert next(iter(server.items.values()))["reference"] == "ref_1"
+
+
+def test_requests_the_server_does_not_understand_are_rejected(server):
+    FakeWorkqueue(server.url, token=server.token).add_item({}, "ref_1")
+
+    assert requests.post(f"{server.url}/workqueues/1/add", json={"reference": "ref_2"}, timeout=5).status_code == 401
+    assert requests.post(f"{server.url}/workqueues/1/items", headers={"Authorization": f"Bearer {server.token}"}, timeout=5).status_code == 404
+
+    assert server.status_counts(1) == {"new": 1}
+    assert [(method, status) for method, _, status in server.rejected] == [("POST", 401), ("POST", 404)]
@@ -0,0 +1,25 @@
+"""Tests for finding the shard sets in processes.finalize_process"""
+
+from processes.finalize_process import _find_shard_sets
+
+TEMPLATE = "Dataudtræk - monday_last_week til sunday_last_week.xlsx"
+
+
+def test_shard_sets_of_every_week_are_found():
+    file_names = [
+        "Dataudtræk - 2026-10-05 til 2026-10-11 (del 2 af 2).xlsx",
+        "Dataudtræk - 2026-10-05 til 2026-10-11 (del 1 af 2).xlsx",
+        "Dataudtræk - 2026-10-05 til 2026-10-11.xlsx",
+        "Dataudtræk - 2026-09-28 til 2026-10-04 (del 1 af 3).xlsx",
+        "Andet (del 1 af 2).xlsx",
+    ]
+
+    assert _find_shard_sets(file_names, TEMPLATE) == {
+        "Dataudtræk - 2026-10-05 til 2026-10-11.xlsx": [
+            (1, 2, "Dataudtræk - 2026-10-05 til 2026-10-11 (del 1 af 2).xlsx"),
+            (2, 2, "Dataudtræk - 2026-10-05 til 2026-10-11 (del 2 af 2).xlsx"),
+        ],
+        "Dataudtræk - 2026-09-28 til 2026-10-04.xlsx": [
+            (1, 3, "Dataudtræk - 2026-09-28 til 2026-10-04 (del 1 af 3).xlsx"),
+        ],
+    }
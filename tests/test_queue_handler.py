@@ -0,0 +1,23 @@
+"""Tests for sharding the week's submissions in processes.queue_handler"""
+
+from processes.queue_handler import shard_submissions
+
+
+def _rows(*languages):
+    return [{"Serial number": serial, "Ønsket sprog": language} for serial, language in enumerate(languages, start=1)]
+
+
+def test_languages_with_the_same_key_share_a_shard():
+    shards = shard_submissions(_rows("Dari/Persisk", "Arabisk", "Dari Persisk", None, ""), "language", 500)
+
+    assert [(key, [row["Serial number"] for row in rows]) for key, rows in shards] == [
+        ("sprog-arabisk", [2]),
+        ("sprog-dari-persisk", [1, 3]),
+        ("sprog-ukendt", [4, 5]),
+    ]
+
+
+def test_size_shards_keep_the_order():
+    shards = shard_submissions(_rows(*["Somali"] * 5), "size", 2)
+
+    assert [(key, len(rows)) for key, rows in shards] == [("del-001", 2), ("del-002", 2), ("del-003", 1)]
@@ -0,0 +1,83 @@
+"""Tests for the incremental sync of helpers.reference_index.ReferenceIndex"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import ats_functions, config
+from helpers.reference_index import ReferenceIndex
+
+
+class FakeListing:
+    """Workqueue items listed oldest first, in pages like iter_workqueue_pages"""
+
+    def __init__(self):
+        self.items: list[dict] = []
+        self.next_id = 1
+        self.pages_read: list[int] = []
+
+    def add(self, *references: str):
+        for reference in references:
+            self.items.append({"id": self.next_id, "reference": reference})
+            self.next_id += 1
+
+    def delete_oldest(self, count: int):
+        del self.items[:count]
+
+    def iter_pages(self, workqueue, first_page: int = 1):
+        page = first_page
+
+        while rows := self.items[(page - 1) * config.ATS_PAGE_SIZE:page * config.ATS_PAGE_SIZE]:
+            self.pages_read.append(page)
+            yield rows
+            page += 1
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    listing = FakeListing()
+    monkeypatch.setattr(ats_functions, "iter_workqueue_pages", listing.iter_pages)
+    monkeypatch.setattr(config, "ATS_PAGE_SIZE", 200)
+
+    return listing
+
+
+def _sync(path, listing: FakeListing) -> set[str]:
+    with ReferenceIndex(str(path), SimpleNamespace(id=1)) as index:
+        index.sync()
+
+        return {item["reference"] for item in listing.items if item["reference"] in index}
+
+
+def test_sync_reads_only_new_pages(tmp_path, listing):
+    path = tmp_path / "index.sqlite3"
+    listing.add(*(f"o{i}" for i in range(400)))
+    _sync(path, listing)
+
+    listing.pages_read.clear()
+    listing.add(*(f"n{i}" for i in range(50)))
+
+    assert _sync(path, listing) == {item["reference"] for item in listing.items}
+    assert listing.pages_read == [2, 3]
+
+
+def test_sync_after_deleting_old_items_and_adding_new_ones(tmp_path, listing):
+    path = tmp_path / "index.sqlite3"
+    listing.add(*(f"o{i}" for i in range(400)))
+    _sync(path, listing)
+
+    listing.delete_oldest(300)
+    listing.add(*(f"n{i}" for i in range(300)))
+
+    assert _sync(path, listing) == {item["reference"] for item in listing.items}
+
+
+def test_sync_after_deleting_all_items(tmp_path, listing):
+    path = tmp_path / "index.sqlite3"
+    listing.add(*(f"o{i}" for i in range(250)))
+    _sync(path, listing)
+
+    listing.delete_oldest(250)
+    listing.add("n0")
+
+    assert _sync(path, listing) == {"n0"}
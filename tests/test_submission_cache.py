@@ -0,0 +1,33 @@
+"""Tests for pruning and purging helpers.submission_cache.SubmissionCache"""
+
+from datetime import date, datetime
+
+from helpers.submission_cache import SubmissionCache
+
+MAPPING = {"completed": "Gennemført"}
+
+
+def _store(cache: SubmissionCache, *submissions: tuple[str, datetime]):
+    cache.store("form", MAPPING, (
+        (form_id, submitted, {"Gennemført": submitted.isoformat()})
+        for form_id, submitted in submissions
+    ))
+
+
+def test_prune_drops_rows_before_the_window(tmp_path):
+    with SubmissionCache(str(tmp_path / "cache.sqlite3")) as cache:
+        _store(cache, ("old", datetime(2026, 9, 1)), ("new", datetime(2026, 10, 6)))
+        cache.set_sync_state("form", MAPPING, datetime(2026, 8, 31), datetime(2026, 10, 6))
+
+        cache.prune("form", datetime(2026, 10, 4))
+
+        assert cache.get_completed_between("form", date(2026, 9, 1), date(2026, 10, 11)) == [{"Gennemført": "2026-10-06T00:00:00"}]
+        assert cache.get_sync_state("form", MAPPING) == (datetime(2026, 10, 4), datetime(2026, 10, 6))
+
+
+def test_delete_drops_purged_rows(tmp_path):
+    with SubmissionCache(str(tmp_path / "cache.sqlite3")) as cache:
+        _store(cache, ("1", datetime(2026, 10, 5)), ("2", datetime(2026, 10, 6)))
+
+        assert cache.delete("form", {"1", "3"}) == 1
+        assert cache.get_completed_between("form", date(2026, 10, 5), date(2026, 10, 11)) == [{"Gennemført": "2026-10-06T00:00:00"}]